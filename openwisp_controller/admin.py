@@ -2,6 +2,9 @@
 Base admin classes and mixins
 """
 from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
 from openwisp_utils.admin import MultitenantAdminMixin as BaseMultitenantAdminMixin
 
@@ -35,3 +38,34 @@ class AlwaysHasChangedMixin(object):
         if self.instance._state.adding:
             return True
         return super(AlwaysHasChangedMixin, self).has_changed()
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    avoids ``COUNT(*)`` on large tables: the number of rows of
+    unfiltered querysets is taken from the statistics of PostgreSQL
+    if greater than ``estimate_threshold`` (other databases and
+    filtered querysets are counted as usual)
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self._get_estimate()
+        if estimate is not None and estimate > self.estimate_threshold:
+            return estimate
+        return super(EstimatedCountPaginator, self).count
+
+    def _get_estimate(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where or query.distinct:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return int(row[0]) if row else None
@@ -1,8 +1,15 @@
 import json
+from collections import OrderedDict
 
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.db.models import Q
+from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import ungettext
 from django_netjsonconfig import settings as django_netjsonconfig_settings
 from django_netjsonconfig.base.admin import (AbstractConfigForm, AbstractConfigInline, AbstractDeviceAdmin,
                                              AbstractTemplateAdmin, AbstractVpnAdmin, AbstractVpnForm,
@@ -12,8 +19,25 @@ from openwisp_users.admin import OrganizationAdmin as BaseOrganizationAdmin
 from openwisp_users.models import Organization
 from openwisp_utils.admin import MultitenantOrgFilter, MultitenantRelatedOrgFilter
 
-from ..admin import AlwaysHasChangedMixin, MultitenantAdminMixin
+from ..admin import AlwaysHasChangedMixin, EstimatedCountPaginator, MultitenantAdminMixin
+from ..tasks import defer
+from . import settings as app_settings
+from . import tasks
+from .cache import get_template_choices
 from .models import Config, Device, OrganizationConfigSettings, Template, Vpn
+from .preview import PreviewInstance
+
+DEFAULT_TEMPLATES_URL_PLACEHOLDER = '00000000-0000-0000-0000-000000000000'
+
+
+class PreviewMixin(object):
+    """
+    renders previews in a bounded pool of threads with a timeout
+    and caches them (see ``openwisp_controller.config.preview``)
+    """
+    def _get_preview_instance(self, request):
+        instance = super(PreviewMixin, self)._get_preview_instance(request)
+        return PreviewInstance(instance)
 
 
 class ConfigForm(AlwaysHasChangedMixin, AbstractConfigForm):
@@ -23,7 +47,18 @@ class ConfigForm(AlwaysHasChangedMixin, AbstractConfigForm):
     def clean_templates(self):
         org = Organization.objects.get(pk=self.data['organization'])
         self.cleaned_data['organization'] = org
-        return super(ConfigForm, self).clean_templates()
+        templates = super(ConfigForm, self).clean_templates()
+        # the configuration has been validated with all its templates,
+        # hence it's not validated again when they're added on save
+        self.instance._validated_templates = set(template.pk for template in templates)
+        return templates
+
+    def _save_m2m(self):
+        try:
+            super(ConfigForm, self)._save_m2m()
+        finally:
+            # the marker must not skip the validation of later changes
+            self.instance.__dict__.pop('_validated_templates', None)
 
 
 class ConfigInline(MultitenantAdminMixin, AbstractConfigInline):
@@ -33,35 +68,106 @@ class ConfigInline(MultitenantAdminMixin, AbstractConfigInline):
     multitenant_shared_relations = ('templates',)
 
 
-class DeviceAdmin(MultitenantAdminMixin, AbstractDeviceAdmin):
+class TemplatesFilter(MultitenantRelatedOrgFilter):
+    """
+    caches the choices (see ``get_template_choices``)
+    """
+    def field_choices(self, field, request, model_admin):
+        load = super(TemplatesFilter, self).field_choices
+        return get_template_choices(request.user,
+                                    lambda: load(field, request, model_admin))
+
+
+class AssignTemplateForm(forms.Form):
+    template = forms.ModelChoiceField(queryset=Template.objects.none(),
+                                      label=_('Template'))
+
+    def __init__(self, user, *args, **kwargs):
+        super(AssignTemplateForm, self).__init__(*args, **kwargs)
+        queryset = Template.objects.select_related('organization')
+        if not user.is_superuser:
+            queryset = queryset.filter(Q(organization__in=user.organizations_pk) |
+                                       Q(organization=None))
+        self.fields['template'].queryset = queryset
+
+
+class DevicePaginator(EstimatedCountPaginator):
+    estimate_threshold = app_settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+
+
+class DeviceAdmin(MultitenantAdminMixin, PreviewMixin, AbstractDeviceAdmin):
     inlines = [ConfigInline]
     list_filter = [('organization', MultitenantOrgFilter),
                    'config__backend',
-                   ('config__templates', MultitenantRelatedOrgFilter),
+                   ('config__templates', TemplatesFilter),
                    'config__status',
                    'created']
     list_select_related = ('config', 'organization')
-
-    def _get_default_template_urls(self):
+    # uses the (organization, created) index
+    ordering = ('-created',)
+    paginator = DevicePaginator
+    # avoids counting all the devices when filters are used
+    show_full_result_count = False
+    actions = ['assign_template_action']
+
+    def _get_default_templates_url(self):
         """
-        returns URLs to get default templates
-        used in change_form.html template
+        returns the URL to get default templates used in
+        change_form.html template, the primary key of the
+        organization is substituted client side
         """
-        organizations = Organization.active.all()
-        urls = {}
-        for org in organizations:
-            urls[str(org.pk)] = reverse('config:get_default_templates', args=[org.pk])
-        return json.dumps(urls)
+        url = reverse('config:get_default_templates', args=[DEFAULT_TEMPLATES_URL_PLACEHOLDER])
+        return json.dumps(url)
 
     def get_extra_context(self, pk=None):
         ctx = super(DeviceAdmin, self).get_extra_context(pk)
-        ctx.update({'default_template_urls': self._get_default_template_urls()})
+        ctx.update({'default_templates_url': self._get_default_templates_url(),
+                    'default_templates_url_placeholder': DEFAULT_TEMPLATES_URL_PLACEHOLDER})
         return ctx
 
     def add_view(self, request, form_url='', extra_context=None):
         extra_context = self.get_extra_context()
         return super(DeviceAdmin, self).add_view(request, form_url, extra_context)
 
+    def assign_template_action(self, request, queryset):
+        """
+        appends a template to the configurations of the selected
+        devices (see ``Config.bulk_assign_template``), the template
+        is chosen in an intermediate page
+        """
+        form = AssignTemplateForm(request.user, request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            configs = Config.objects.filter(device__in=queryset)
+            assigned, invalid = Config.bulk_assign_template(form.cleaned_data['template'], configs)
+            count = len(assigned)
+            message = ungettext('The template was assigned to %(count)d device.',
+                                'The template was assigned to %(count)d devices.',
+                                count) % {'count': count}
+            self.message_user(request, message)
+            errors = OrderedDict()
+            for config, error in invalid:
+                errors.setdefault(force_text(error), []).append(config.name)
+            for error, names in errors.items():
+                devices = ', '.join(names[:10])
+                if len(names) > 10:
+                    devices = '{0} (+{1})'.format(devices, len(names) - 10)
+                self.message_user(request, '{0}: {1}'.format(devices, error), messages.ERROR)
+            return None
+        context = self.admin_site.each_context(request)
+        context.update({
+            'title': _('Assign template'),
+            'opts': self.model._meta,
+            'form': form,
+            'count': queryset.count(),
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'media': self.media,
+        })
+        return TemplateResponse(request, 'admin/config/assign_template.html', context)
+
+    assign_template_action.short_description = _('Assign template to selected devices')
+
 
 DeviceAdmin.list_display.insert(1, 'organization')
 DeviceAdmin.fields.insert(1, 'organization')
@@ -72,7 +178,7 @@ class TemplateForm(BaseForm):
         model = Template
 
 
-class TemplateAdmin(MultitenantAdminMixin, AbstractTemplateAdmin):
+class TemplateAdmin(MultitenantAdminMixin, PreviewMixin, AbstractTemplateAdmin):
     form = TemplateForm
     multitenant_shared_relations = ('vpn',)
 
@@ -87,9 +193,23 @@ class VpnForm(AbstractVpnForm):
         model = Vpn
 
 
-class VpnAdmin(MultitenantAdminMixin, AbstractVpnAdmin):
+class VpnAdmin(MultitenantAdminMixin, PreviewMixin, AbstractVpnAdmin):
     form = VpnForm
     multitenant_shared_relations = ('ca', 'cert')
+    actions = ['reissue_client_certs_action']
+
+    def reissue_client_certs_action(self, request, queryset):
+        """
+        rotates the client certificates of the selected VPNs
+        (in the background when using an asynchronous task backend)
+        """
+        for vpn in queryset:
+            defer(tasks.reissue_vpn_client_certs, str(vpn.pk))
+        self.message_user(request, _('The certificates of the VPN clients '
+                                     'are being reissued.'))
+
+    reissue_client_certs_action.short_description = _('Reissue client certificates '
+                                                      'of selected VPNs')
 
 
 VpnAdmin.list_display.insert(1, 'organization')
@@ -1,4 +1,9 @@
+from django.db.models.signals import post_delete, post_save, pre_save
 from django_netjsonconfig.apps import DjangoNetjsonconfigApp
+from django_netjsonconfig.signals import config_modified
+
+from ..tasks import is_async
+from .signals import configs_modified
 
 
 class ConfigConfig(DjangoNetjsonconfigApp):
@@ -6,9 +11,78 @@ class ConfigConfig(DjangoNetjsonconfigApp):
     label = 'config'
 
     def __setmodels__(self):
-        from .models import Config, VpnClient
+        from .models import Config, Device, OrganizationConfigSettings, Template, Vpn, VpnClient
         self.config_model = Config
+        self.device_model = Device
+        self.template_model = Template
+        self.vpn_model = Vpn
         self.vpnclient_model = VpnClient
+        self.org_settings_model = OrganizationConfigSettings
+
+    def connect_signals(self):
+        """
+        * invalidation of the stored configuration checksum
+        * generation of checksums in the background (asynchronous task backends)
+        * invalidation of the cache of registration secrets
+        * invalidation of the cache of device authentication data
+        * invalidation of the cache of default templates
+        """
+        super(ConfigConfig, self).connect_signals()
+        config_modified.connect(self.config_model.config_modified_receiver,
+                                sender=self.config_model,
+                                dispatch_uid='invalidate_checksum_db')
+        post_save.connect(self.device_model.post_save,
+                          sender=self.device_model,
+                          dispatch_uid='device_invalidate_checksum_db')
+        post_save.connect(self.vpnclient_model.post_save,
+                          sender=self.vpnclient_model,
+                          dispatch_uid='vpnclient_invalidate_checksum_db')
+        post_save.connect(self.vpn_model.post_save,
+                          sender=self.vpn_model,
+                          dispatch_uid='vpn_invalidate_checksum_db')
+        post_save.connect(self.vpn_model.ca_post_save,
+                          sender=self.vpn_model.ca.field.related_model,
+                          dispatch_uid='ca_invalidate_checksum_db')
+        post_save.connect(self.vpn_model.cert_post_save,
+                          sender=self.vpn_model.cert.field.related_model,
+                          dispatch_uid='cert_invalidate_checksum_db')
+        pre_save.connect(self.org_settings_model.pre_save,
+                         sender=self.org_settings_model,
+                         dispatch_uid='org_settings_previous_secret')
+        post_save.connect(self.org_settings_model.post_save,
+                          sender=self.org_settings_model,
+                          dispatch_uid='org_settings_invalidate_cache')
+        post_delete.connect(self.org_settings_model.post_save,
+                            sender=self.org_settings_model,
+                            dispatch_uid='org_settings_delete_invalidate_cache')
+        post_save.connect(self.org_settings_model.organization_post_save,
+                          sender=self.org_settings_model.organization.field.related_model,
+                          dispatch_uid='organization_invalidate_registration_cache')
+        post_delete.connect(self.device_model.post_delete,
+                            sender=self.device_model,
+                            dispatch_uid='device_invalidate_auth')
+        post_save.connect(self.config_model.post_save,
+                          sender=self.config_model,
+                          dispatch_uid='config_invalidate_device_auth')
+        post_delete.connect(self.config_model.post_delete,
+                            sender=self.config_model,
+                            dispatch_uid='config_delete_invalidate_device_auth')
+        post_save.connect(self.device_model.organization_post_save,
+                          sender=self.device_model.organization.field.related_model,
+                          dispatch_uid='organization_invalidate_device_auth')
+        post_save.connect(self.template_model.post_save,
+                          sender=self.template_model,
+                          dispatch_uid='template_invalidate_default_templates')
+        post_delete.connect(self.template_model.post_save,
+                            sender=self.template_model,
+                            dispatch_uid='template_delete_invalidate_default_templates')
+        post_save.connect(self.template_model.post_save,
+                          sender=self.device_model.organization.field.related_model,
+                          dispatch_uid='organization_invalidate_default_templates')
+        if is_async():
+            configs_modified.connect(self.config_model.configs_modified_receiver,
+                                     sender=self.config_model,
+                                     dispatch_uid='update_configs_checksum')
 
     def check_settings(self):
         pass
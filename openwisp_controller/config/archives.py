@@ -0,0 +1,88 @@
+import hashlib
+import logging
+
+from django.core.files.base import ContentFile
+from django.http import FileResponse
+from django.utils.module_loading import import_string
+
+from . import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigArchiveStore(object):
+    """
+    Stores generated configuration archives (tar.gz)
+    keyed by the checksum of their contents, each archive
+    is generated only once and then read from the storage
+    until the configuration changes
+    """
+    def __init__(self, storage):
+        self.storage = storage
+
+    def get_path(self, config, checksum):
+        return '{0}/{1}.tar.gz'.format(config.pk.hex, checksum)
+
+    def open(self, config):
+        """
+        returns the stored archive of ``config`` opened in binary mode,
+        generates and stores a new one if the checksum has changed
+        """
+        checksum = config.checksum_db
+        if not checksum or not self.storage.exists(self.get_path(config, checksum)):
+            checksum = self.save(config)
+        return self.storage.open(self.get_path(config, checksum), 'rb')
+
+    def save(self, config):
+        """
+        generates the archive of ``config``, stores it,
+        updates the stored checksum and removes outdated archives
+        """
+        contents = config.generate().getvalue()
+        checksum = hashlib.md5(contents).hexdigest()
+        if config.checksum_db != checksum:
+            config.update_checksum_db(checksum)
+        path = self.get_path(config, checksum)
+        if not self.storage.exists(path):
+            self.storage.save(path, ContentFile(contents))
+        self.delete_outdated(config, checksum)
+        return checksum
+
+    def delete_outdated(self, config, checksum):
+        directory = config.pk.hex
+        current = '{0}.tar.gz'.format(checksum)
+        try:
+            filenames = self.storage.listdir(directory)[1]
+        except (NotImplementedError, OSError):  # pragma: nocover
+            return
+        for filename in filenames:
+            if filename == current:
+                continue
+            try:
+                self.storage.delete('{0}/{1}'.format(directory, filename))
+            except OSError:  # pragma: nocover
+                logger.warning('could not delete outdated archive '
+                               '{0}/{1}'.format(directory, filename))
+
+
+def get_archive_store():
+    """
+    returns a ``ConfigArchiveStore`` instance or ``None`` if
+    ``OPENWISP_CONTROLLER_CONFIG_ARCHIVE_ROOT`` is not set
+    """
+    if not app_settings.CONFIG_ARCHIVE_ROOT:
+        return None
+    storage_class = import_string(app_settings.CONFIG_ARCHIVE_STORAGE)
+    return ConfigArchiveStore(storage_class(location=app_settings.CONFIG_ARCHIVE_ROOT))
+
+
+def send_archive(store, config):
+    """
+    returns a streaming response which
+    includes the stored configuration archive
+    """
+    response = FileResponse(store.open(config),
+                            content_type='application/octet-stream')
+    response['Content-Disposition'] = 'attachment; filename={0}.tar.gz'.format(config.name)
+    response['X-Openwisp-Controller'] = 'true'
+    return response
@@ -0,0 +1,305 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from copy import deepcopy
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from netjsonconfig.utils import merge_config
+
+from . import settings as app_settings
+
+
+class LocalCache(object):
+    """
+    thread safe in-process cache with optional
+    expiration, LRU eviction and hit/miss counters
+    """
+    def __init__(self, maxsize=1000, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.time():
+                self.misses += 1
+                return default
+            # reinsert as most recently used
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = None
+        if self.timeout is not None:
+            expires = time.time() + self.timeout
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_registration_cache = LocalCache(timeout=app_settings.LOCAL_CACHE_TIMEOUT)
+
+
+def _get_registration_cache_key(secret):
+    # the secret itself is not used in the key
+    digest = hashlib.sha256(secret.encode('utf8')).hexdigest()
+    return 'openwisp_controller.registration.{0}'.format(digest)
+
+
+def is_shared_cache():
+    """
+    returns ``False`` if the default django cache is kept in the memory
+    of each process (``LocMemCache``), in which case invalidations
+    do not reach the other processes
+    """
+    backend = settings.CACHES.get(DEFAULT_CACHE_ALIAS, {}).get('BACKEND')
+    return backend != 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def _get_or_load(local_cache, key, load, timeout, negative_timeout):
+    """
+    looks up ``key`` in ``local_cache``, then in the django cache,
+    calls ``load`` if both miss; ``load`` must return ``False``
+    for missing objects, which are cached with ``negative_timeout``;
+    timeouts are capped to the one of ``local_cache`` if the
+    django cache is not shared among processes
+    """
+    value = local_cache.get(key)
+    if value is None:
+        value = cache.get(key)
+    if value is None:
+        value = load()
+        timeout = timeout if value else negative_timeout
+        if not is_shared_cache():
+            timeout = min(timeout, local_cache.timeout)
+        cache.set(key, value, timeout)
+    local_cache.set(key, value)
+    return value or None
+
+
+def get_registration_settings(secret):
+    """
+    returns a dictionary with the keys ``organization_id``,
+    ``is_active`` and ``registration_enabled`` of the
+    organization having ``secret`` as shared secret,
+    ``None`` if no organization matches the secret
+
+    results (including unknown secrets) are stored in a short lived
+    in-process cache and in the django cache, both invalidated when
+    ``OrganizationConfigSettings`` or ``Organization`` objects change
+    """
+    return _get_or_load(_registration_cache,
+                        _get_registration_cache_key(secret),
+                        lambda: _load_registration_settings(secret),
+                        app_settings.REGISTRATION_CACHE_TIMEOUT,
+                        app_settings.REGISTRATION_NEGATIVE_CACHE_TIMEOUT)
+
+
+def _load_registration_settings(secret):
+    from .models import OrganizationConfigSettings
+    try:
+        org_settings = OrganizationConfigSettings.objects \
+                                                 .select_related('organization') \
+                                                 .get(shared_secret=secret)
+    except OrganizationConfigSettings.DoesNotExist:
+        # negative results are cached too
+        return False
+    return {'organization_id': org_settings.organization_id,
+            'is_active': org_settings.organization.is_active,
+            'registration_enabled': org_settings.registration_enabled}
+
+
+def invalidate_registration_settings(*secrets):
+    keys = [_get_registration_cache_key(secret) for secret in secrets if secret]
+    for key in keys:
+        _registration_cache.delete(key)
+    cache.delete_many(keys)
+
+
+_device_auth_cache = LocalCache(maxsize=10000, timeout=app_settings.LOCAL_CACHE_TIMEOUT)
+
+
+def get_key_hash(key):
+    return hashlib.sha256(key.encode('utf8')).hexdigest()
+
+
+def _get_device_auth_cache_key(pk):
+    return 'openwisp_controller.device_auth.{0}'.format(pk.hex)
+
+
+def get_device_auth(pk):
+    """
+    returns a dictionary with the keys ``key_hash`` (see ``get_key_hash``),
+    ``is_active`` (organization flag) and ``config_id`` of the device
+    having the primary key ``pk``, ``None`` if the device does not
+    exist or does not have a configuration
+
+    results are cached like in ``get_registration_settings``,
+    invalidated when devices, configurations or organizations change
+    """
+    # devices may use both the hex and the hyphenated form of their UUID
+    try:
+        pk = uuid.UUID(str(pk))
+    except ValueError:
+        return None
+    return _get_or_load(_device_auth_cache,
+                        _get_device_auth_cache_key(pk),
+                        lambda: _load_device_auth(pk),
+                        app_settings.DEVICE_AUTH_CACHE_TIMEOUT,
+                        app_settings.DEVICE_AUTH_CACHE_TIMEOUT)
+
+
+def _load_device_auth(pk):
+    from .models import Device
+    device = Device.objects.filter(pk=pk, config__isnull=False) \
+                           .values_list('key', 'organization__is_active', 'config__id') \
+                           .first()
+    if not device:
+        return False
+    key, is_active, config_id = device
+    return {'key_hash': get_key_hash(key),
+            'is_active': is_active,
+            'config_id': config_id}
+
+
+def invalidate_device_auth(*pk_list):
+    keys = [_get_device_auth_cache_key(uuid.UUID(str(pk))) for pk in pk_list]
+    for key in keys:
+        _device_auth_cache.delete(key)
+    cache.delete_many(keys)
+
+
+_merged_templates_cache = LocalCache(maxsize=app_settings.MERGED_TEMPLATES_CACHE_SIZE)
+
+
+def get_merged_templates(backend_class, templates):
+    """
+    returns the configurations of ``templates`` merged in order
+    (as netjsonconfig does), ``None`` if ``templates`` is empty
+
+    the result is kept in an in-process LRU cache, keyed by backend
+    and ordered template ids and modification times, so that devices
+    sharing the same templates do not merge them again on each render;
+    on cache hits the configuration of the templates is not accessed,
+    hence ``templates`` may be loaded with only their ``id`` and ``modified``
+    fields: on cache misses their full rows are loaded with one query
+    """
+    if not templates:
+        return None
+    key = (backend_class, tuple((t.pk, t.modified) for t in templates))
+    merged = _merged_templates_cache.get(key)
+    if merged is None:
+        templates = _load_templates(templates)
+        # the rows may have changed since the key was computed
+        key = (backend_class, tuple((t.pk, t.modified) for t in templates))
+        merged = {}
+        for template in templates:
+            merged = merge_config(merged, template.config, backend_class.list_identifiers)
+        merged = deepcopy(merged)
+        _merged_templates_cache.set(key, merged)
+    # netjsonconfig evaluates variables in place
+    return deepcopy(merged)
+
+
+def _load_templates(templates):
+    # jsonfield can't load deferred fields lazily
+    if not any('config' in t.get_deferred_fields() for t in templates):
+        return templates
+    model = templates[0]._meta.concrete_model
+    loaded = model.objects.in_bulk([t.pk for t in templates])
+    return [loaded[t.pk] for t in templates if t.pk in loaded]
+
+
+_TEMPLATES_VERSION_KEY = 'openwisp_controller.templates.version'
+
+
+def _get_templates_cache_key(name, suffix):
+    # shared templates affect every organization, hence a version
+    # number is used to invalidate the entries of all of them at once
+    cache.add(_TEMPLATES_VERSION_KEY, int(time.time() * 1000), None)
+    version = cache.get(_TEMPLATES_VERSION_KEY)
+    return 'openwisp_controller.{0}.{1}.{2}'.format(name, version, suffix)
+
+
+def get_default_template_pks(organization_id):
+    """
+    returns the primary keys (as strings) of the default templates
+    of the active organization ``organization_id``, ``None`` if the
+    organization does not exist or is not active
+
+    results are stored in the django cache and invalidated when
+    templates or organizations change (see ``invalidate_templates``)
+    """
+    try:
+        organization_id = uuid.UUID(str(organization_id))
+    except ValueError:
+        return None
+    key = _get_templates_cache_key('default_templates', organization_id.hex)
+    value = cache.get(key)
+    if value is None:
+        value = _load_default_template_pks(organization_id)
+        cache.set(key, value, app_settings.TEMPLATES_CACHE_TIMEOUT)
+    return value if value is not False else None
+
+
+def _load_default_template_pks(organization_id):
+    from openwisp_users.models import Organization
+    from .models import Template
+    from .utils import get_default_templates_queryset
+    if not Organization.objects.filter(pk=organization_id, is_active=True).exists():
+        return False
+    templates = get_default_templates_queryset(organization_id, model=Template)
+    return [str(pk) for pk in templates.values_list('pk', flat=True)]
+
+
+def get_template_choices(user, load):
+    """
+    returns the choices of the templates filter of the admin
+    for ``user`` (which depend on its organizations), ``load``
+    is called on cache misses; invalidated like ``get_default_template_pks``
+    """
+    if user.is_superuser:
+        suffix = 'all'
+    else:
+        organizations = sorted(str(pk) for pk, in user.organizations_pk)
+        suffix = hashlib.sha256(','.join(organizations).encode('utf8')).hexdigest()
+    key = _get_templates_cache_key('template_choices', suffix)
+    choices = cache.get(key)
+    if choices is None:
+        choices = list(load())
+        cache.set(key, choices, app_settings.TEMPLATES_CACHE_TIMEOUT)
+    return choices
+
+
+def invalidate_templates():
+    try:
+        cache.incr(_TEMPLATES_VERSION_KEY)
+    except ValueError:
+        # the version is not in the cache anymore, a new one
+        # (based on the current time) will be generated
+        pass
@@ -1,6 +1,11 @@
+from django.conf.urls import url
 from django_netjsonconfig.utils import get_controller_urls
 
 from . import views
 
 app_name = 'openwisp_controller'
-urlpatterns = get_controller_urls(views)
+urlpatterns = get_controller_urls(views) + [
+    url(r'^controller/register-bulk/$',
+        views.register_bulk,
+        name='register_bulk'),
+]
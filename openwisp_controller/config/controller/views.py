@@ -1,33 +1,165 @@
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.db.models import Q
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import quote_etag
+from django_netjsonconfig import settings
 from django_netjsonconfig.controller.generics import (BaseChecksumView, BaseDownloadConfigView,
                                                       BaseRegisterView, BaseReportStatusView)
-from django_netjsonconfig.utils import invalid_response
+from django_netjsonconfig.utils import (ControllerResponse, forbid_unallowed, get_object_or_404,
+                                        invalid_response, send_file)
+
+from openwisp_users.models import Organization
 
-from ..models import Device, OrganizationConfigSettings
+from .. import settings as app_settings
+from ..archives import get_archive_store, send_archive
+from ..cache import get_device_auth, get_key_hash, get_registration_settings
+from ..models import Config, Device
+from ..status import update_status
+from ..utils import get_default_templates_queryset, update_last_ip
 
 
 class ActiveOrgMixin(object):
     """
-    adds check to organization.is_active to ``get_object`` method
+    authenticates devices through a cache (see ``get_device_auth``),
+    which includes the check of organization.is_active, and
+    retrieves config objects (with their device) by primary key
     """
+    def get_device_auth(self, pk):
+        auth = get_device_auth(pk)
+        if not auth or not auth['is_active']:
+            raise Http404()
+        return auth
+
+    def forbidden(self, request, param_group, pk):
+        """
+        like ``forbid_unallowed`` for the ``key`` parameter, but
+        compares it with the cached key hash (no database queries)
+        """
+        return self.forbidden_key(request, getattr(request, param_group).get('key'), pk)
+
+    def forbidden_key(self, request, key, pk):
+        auth = self.get_device_auth(pk)
+        if not key:
+            error = 'error: missing required parameter "key"\n'
+            return invalid_response(request, error, status=400)
+        if not constant_time_compare(get_key_hash(key), auth['key_hash']):
+            return invalid_response(request, 'error: wrong key\n', status=403)
+
     def get_object(self, *args, **kwargs):
-        kwargs['organization__is_active'] = True
-        return super(ActiveOrgMixin, self).get_object(*args, **kwargs)
+        auth = self.get_device_auth(kwargs['pk'])
+        queryset = Config.objects.select_related('device')
+        return get_object_or_404(queryset, pk=auth['config_id']).device
+
+
+class UpdateLastIpMixin(object):
+    def update_last_ip(self, config, request):
+        """ see ``openwisp_controller.config.utils.update_last_ip`` """
+        update_last_ip(config, request)
+
+
+class ETagMixin(object):
+    """
+    adds support for conditional requests (``If-None-Match``),
+    the configuration checksum is used as ETag
+    """
+    def get_not_modified_response(self, request, checksum):
+        """
+        returns a ``304 Not Modified`` response if ``checksum``
+        matches the ``If-None-Match`` header, ``None`` otherwise
+        """
+        if not checksum:
+            return None
+        response = get_conditional_response(request, etag=quote_etag(checksum))
+        if response is not None:
+            response['X-Openwisp-Controller'] = 'true'
+            self.set_etag(response, checksum)
+        return response
 
+    def set_etag(self, response, checksum):
+        response['ETag'] = quote_etag(checksum)
+        return response
 
-class ChecksumView(ActiveOrgMixin, BaseChecksumView):
+
+class ChecksumView(UpdateLastIpMixin, ETagMixin, ActiveOrgMixin, BaseChecksumView):
     model = Device
 
+    def get(self, request, *args, **kwargs):
+        """
+        returns the stored checksum, the configuration
+        is generated only if the checksum has been invalidated
+        """
+        bad_request = self.forbidden(request, 'GET', kwargs['pk'])
+        if bad_request:
+            return bad_request
+        device = self.get_object(*args, **kwargs)
+        self.update_last_ip(device.config, request)
+        checksum = device.config.get_cached_checksum()
+        response = (self.get_not_modified_response(request, checksum) or
+                    ControllerResponse(checksum, content_type='text/plain'))
+        return self.set_etag(response, checksum)
+
 
-class DownloadConfigView(ActiveOrgMixin, BaseDownloadConfigView):
+class DownloadConfigView(UpdateLastIpMixin, ETagMixin, ActiveOrgMixin, BaseDownloadConfigView):
     model = Device
 
+    def get(self, request, *args, **kwargs):
+        """
+        streams the stored configuration archive if
+        ``OPENWISP_CONTROLLER_CONFIG_ARCHIVE_ROOT`` is set,
+        otherwise generates the archive on each request;
+        the archive is not generated at all if the device
+        already has the current version (``If-None-Match``)
+        """
+        bad_request = self.forbidden(request, 'GET', kwargs['pk'])
+        if bad_request:
+            return bad_request
+        device = self.get_object(*args, **kwargs)
+        config = device.config
+        not_modified = self.get_not_modified_response(request, config.checksum_db)
+        self.update_last_ip(config, request)
+        if not_modified:
+            return not_modified
+        store = get_archive_store()
+        if store:
+            response = send_archive(store, config)
+        else:
+            contents = config.generate().getvalue()
+            config.update_checksum_db(hashlib.md5(contents).hexdigest())
+            response = send_file(filename='{0}.tar.gz'.format(config.name),
+                                 contents=contents)
+        return self.set_etag(response, config.checksum_db)
+
 
 class ReportStatusView(ActiveOrgMixin, BaseReportStatusView):
     model = Device
 
+    def post(self, request, *args, **kwargs):
+        """
+        status changes are written through ``update_status``,
+        which skips no-op writes and may buffer them
+        """
+        bad_request = self.forbidden(request, 'POST', kwargs['pk'])
+        if bad_request:
+            return bad_request
+        device = self.get_object(*args, **kwargs)
+        config = device.config
+        allowed_status = [choices[0] for choices in config.STATUS]
+        bad_request = forbid_unallowed(request, 'POST', 'status', allowed_status)
+        if bad_request:
+            return bad_request
+        update_status(config, request.POST['status'])
+        return ControllerResponse('report-result: success\n'
+                                  'current-status: {}\n'.format(config.status),
+                                  content_type='text/plain')
 
-class RegisterView(BaseRegisterView):
+
+class RegisterView(UpdateLastIpMixin, BaseRegisterView):
     model = Device
 
     def forbidden(self, request):
@@ -35,20 +167,22 @@ class RegisterView(BaseRegisterView):
         ensures request is authorized:
             - secret matches an organization's shared_secret
             - the organization has registration_enabled set to True
+        (lookups of secrets are cached, see ``get_registration_settings``)
         """
-        try:
-            secret = request.POST.get('secret')
-            org_settings = OrganizationConfigSettings.objects \
-                                                     .select_related('organization') \
-                                                     .get(shared_secret=secret,
-                                                          organization__is_active=True)
-        except OrganizationConfigSettings.DoesNotExist:
+        return self.forbidden_secret(request, request.POST.get('secret'))
+
+    def forbidden_secret(self, request, secret):
+        org_settings = get_registration_settings(secret)
+        if not org_settings or not org_settings['is_active']:
             return invalid_response(request, 'error: unrecognized secret', status=403)
-        if not org_settings.registration_enabled:
+        if not org_settings['registration_enabled']:
             return invalid_response(request, 'error: registration disabled', status=403)
         # set an organization attribute as a side effect
         # this attribute will be used in ``init_object``
-        self.organization = org_settings.organization
+        try:
+            self.organization = Organization.objects.get(pk=org_settings['organization_id'])
+        except Organization.DoesNotExist:
+            return invalid_response(request, 'error: unrecognized secret', status=403)
 
     def init_object(self, **kwargs):
         config = super(RegisterView, self).init_object(**kwargs)
@@ -63,7 +197,219 @@ class RegisterView(BaseRegisterView):
                                Q(organization=None))
 
 
+class BulkRegisterView(RegisterView):
+    """
+    registers many new devices of the same organization in one request,
+    expects a JSON body like::
+
+        {
+            "secret": "<organization shared secret>",
+            "devices": [
+                {"name": "...", "mac_address": "...", "backend": "...", "tags": "..."}
+            ]
+        }
+
+    default and tagged templates are looked up once for the whole batch,
+    devices, configurations and their templates are created with bulk inserts;
+    registration is atomic: if any device is invalid nothing is created
+    and the errors are returned indexed by position in the list
+    """
+    def get_devices(self, request):
+        """
+        returns the list of devices in the JSON body,
+        ``None`` if the body is malformed
+        """
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        self.secret = data.get('secret')
+        devices = data.get('devices')
+        if not isinstance(devices, list) or not all(isinstance(d, dict) for d in devices):
+            return None
+        return devices
+
+    def invalid(self, request):
+        """
+        ensures request is well formed
+        """
+        if self.devices is None:
+            return invalid_response(request, 'error: malformed JSON body', status=400)
+        if not self.secret:
+            return invalid_response(request, 'error: missing required parameter "secret"\n',
+                                    status=400)
+        if not self.devices:
+            return invalid_response(request, 'error: missing required parameter "devices"\n',
+                                    status=400)
+        max_devices = app_settings.BULK_REGISTRATION_MAX_DEVICES
+        if len(self.devices) > max_devices:
+            return invalid_response(request,
+                                    'error: too many devices (max {0})'.format(max_devices),
+                                    status=400)
+
+    def forbidden(self, request):
+        return self.forbidden_secret(request, self.secret)
+
+    def get_tagged_templates(self, tags):
+        """
+        returns a dictionary which maps each tag to the list
+        of templates it selects
+        """
+        tagged = {}
+        if not tags:
+            return tagged
+        template_model = self.model.get_config_model().get_template_model()
+        queryset = template_model.objects.filter(Q(organization=self.organization) |
+                                                 Q(organization=None))
+        pairs = queryset.filter(tags__name__in=list(tags)) \
+                        .order_by('created') \
+                        .values_list('pk', 'tags__name')
+        pairs = [(pk, name) for pk, name in pairs if name in tags]
+        templates = queryset.select_related('vpn') \
+                            .in_bulk(set(pk for pk, name in pairs))
+        for pk, name in pairs:
+            tagged.setdefault(name, []).append(templates[pk])
+        return tagged
+
+    def get_device_tags(self, options):
+        tags = options.get('tags') or []
+        if not isinstance(tags, list):
+            tags = str(tags).split()
+        return tags
+
+    def clean_devices(self, devices, configs):
+        """
+        validates devices and ensures names and mac addresses are not
+        duplicated, both in the batch and in the database (single query)
+        """
+        errors = {}
+        allowed_backends = [path for path, name in settings.BACKENDS]
+        for index, (device, config) in enumerate(zip(devices, configs)):
+            try:
+                if config.backend not in allowed_backends:
+                    raise ValidationError({'backend': ['wrong backend']})
+                # organization is validated in ``forbidden``
+                device.full_clean(exclude=['organization'], validate_unique=False)
+            except ValidationError as e:
+                errors[index] = e.message_dict
+        names = [device.name for device in devices]
+        macs = [device.mac_address for device in devices]
+        existing = self.model.objects.filter(Q(name__in=names) | Q(mac_address__in=macs)) \
+                                     .values_list('name', 'mac_address')
+        taken_names = set(name for name, mac in existing)
+        taken_macs = set(mac for name, mac in existing)
+        for index, device in enumerate(devices):
+            error = errors.setdefault(index, {})
+            if device.name in taken_names:
+                error.setdefault('name', []).append('Device with this Name already exists.')
+            if device.mac_address in taken_macs:
+                error.setdefault('mac_address', []).append('Device with this Mac address '
+                                                           'already exists.')
+            taken_names.add(device.name)
+            taken_macs.add(device.mac_address)
+            if not error:
+                del errors[index]
+        return errors
+
+    def clean_configs(self, config_templates):
+        """
+        validates the configurations, which are empty and differ
+        only in the device context, hence the backend validation is
+        performed only once for each combination of backend and templates
+        """
+        errors = {}
+        validated = {}
+        for index, (config, templates) in enumerate(config_templates):
+            combination = (config.backend, tuple(t.pk for t in templates))
+            if combination not in validated:
+                try:
+                    config.clean_netjsonconfig_backend(
+                        config.get_backend_instance(template_instances=templates)
+                    )
+                except ValidationError as e:
+                    validated[combination] = {'config': e.messages}
+                else:
+                    validated[combination] = None
+            if validated[combination]:
+                errors[index] = validated[combination]
+        return errors
+
+    def post(self, request, *args, **kwargs):
+        """
+        POST logic
+        """
+        if not settings.REGISTRATION_ENABLED:
+            return ControllerResponse(status=404)
+        self.secret = None
+        self.devices = self.get_devices(request)
+        # ensure request is valid
+        bad_response = self.invalid(request)
+        if bad_response:
+            return bad_response
+        # ensure request is allowed
+        forbidden = self.forbidden(request)
+        if forbidden:
+            return forbidden
+        last_ip = request.META.get('REMOTE_ADDR')
+        configs = []
+        for options in self.devices:
+            options = options.copy()
+            # keys are always generated, last_ip is taken from the request
+            for attr in ['key', 'last_ip']:
+                options.pop(attr, None)
+            options.setdefault('backend', None)
+            configs.append(self.init_object(last_ip=last_ip, **options))
+        devices = [config.device for config in configs]
+        errors = self.clean_devices(devices, configs)
+        if errors:
+            return self.error_response(errors)
+        # default and tagged templates are retrieved only once
+        config_model = self.model.get_config_model()
+        default_templates = list(get_default_templates_queryset(
+            self.organization.pk,
+            model=config_model.get_template_model()
+        ).select_related('vpn'))
+        all_tags = set()
+        for options in self.devices:
+            all_tags.update(self.get_device_tags(options))
+        tagged_templates = self.get_tagged_templates(all_tags)
+        config_templates = []
+        for config, options in zip(configs, self.devices):
+            templates = [t for t in default_templates if t.backend == config.backend]
+            for tag in self.get_device_tags(options):
+                for template in tagged_templates.get(tag, []):
+                    if template not in templates:
+                        templates.append(template)
+            config_templates.append((config, templates))
+        errors = self.clean_configs(config_templates)
+        if errors:
+            return self.error_response(errors)
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(devices)
+                config_model.objects.bulk_create(configs)
+                config_model.bulk_add_templates(config_templates)
+        # concurrent registration of the same devices
+        except IntegrityError as e:
+            return invalid_response(request, 'error: {0}'.format(e), status=409)
+        result = [{'id': device.pk.hex,
+                   'key': device.key,
+                   'name': device.name,
+                   'mac_address': device.mac_address} for device in devices]
+        return ControllerResponse(json.dumps({'devices': result}, indent=4),
+                                  content_type='application/json',
+                                  status=201)
+
+    def error_response(self, errors):
+        return ControllerResponse(json.dumps(errors, indent=4, sort_keys=True),
+                                  content_type='application/json',
+                                  status=400)
+
+
 checksum = ChecksumView.as_view()
 download_config = DownloadConfigView.as_view()
 report_status = ReportStatusView.as_view()
 register = RegisterView.as_view()
+register_bulk = BulkRegisterView.as_view()
@@ -0,0 +1,64 @@
+import time
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.encoding import force_text
+
+from ... import settings as app_settings
+from ...models import DhParams, Vpn
+
+
+def generate(length):
+    # openssl runs in a subprocess, hence threads are enough to use all cores
+    return length, force_text(Vpn.dhparam(length))
+
+
+class Command(BaseCommand):
+    help = ('Fills the pool of pre-generated Diffie-Hellman parameters '
+            'up to the depth configured in OPENWISP_CONTROLLER_DH_POOL')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', action='store', dest='processes',
+                            default=cpu_count(), type=int,
+                            help='Number of parameters generated in parallel '
+                                 '(defaults to the number of CPUs).')
+        parser.add_argument('--interval', action='store', dest='interval',
+                            default=0, type=int,
+                            help='Checks the pool every INTERVAL seconds '
+                                 'instead of exiting after filling it.')
+        parser.add_argument('--status', action='store_true', dest='status',
+                            help='Prints the depth of the pool and exits.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['status']:
+            self.print_depth()
+            return
+        pool = ThreadPool(options['processes'])
+        try:
+            while True:
+                self.fill(pool)
+                if not options['interval']:
+                    break
+                close_old_connections()
+                time.sleep(options['interval'])
+        finally:
+            pool.terminate()
+
+    def fill(self, pool):
+        depth = DhParams.get_pool_depth()
+        lengths = []
+        for length, size in app_settings.DH_POOL.items():
+            lengths += [length] * max(size - depth.get(length, 0), 0)
+        for length, dh in pool.imap_unordered(generate, lengths):
+            DhParams.objects.create(length=length, dh=dh)
+            if self.verbosity > 1:
+                self.stdout.write('Generated {0} bit parameters'.format(length))
+        if self.verbosity > 0:
+            self.print_depth()
+
+    def print_depth(self):
+        for length, count in sorted(DhParams.get_pool_depth().items()):
+            self.stdout.write('{0} bit: {1}'.format(length, count))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Config
+
+
+class Command(BaseCommand):
+    help = ('Resets the stored checksum of all configurations, to be run after changing '
+            'settings which affect the configuration context (eg: NETJSONCONFIG_CONTEXT)')
+
+    def handle(self, *args, **options):
+        count = Config.objects.exclude(checksum_db=None).update(checksum_db=None)
+        if options['verbosity'] > 0:
+            self.stdout.write('Reset the checksum of {0} configurations'.format(count))
@@ -0,0 +1,19 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from ....tasks import TASK_CHANNEL
+
+
+class Command(BaseCommand):
+    help = 'Runs a worker which executes the tasks deferred with ChannelsBackend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', action='store', dest='threads',
+                            default=1, type=int,
+                            help='Number of threads to execute.')
+
+    def handle(self, *args, **options):
+        call_command('runworker',
+                     only_channels=[TASK_CHANNEL],
+                     threads=options['threads'],
+                     verbosity=options['verbosity'])
@@ -0,0 +1,18 @@
+# Generated by Django 2.0.2 on 2018-04-10 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0012_auto_20180219_1501'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='config',
+            name='checksum_db',
+            field=models.CharField(blank=True, editable=False, help_text='checksum of the last generated configuration, reset whenever the configuration changes', max_length=32, null=True, verbose_name='configuration checksum'),
+        ),
+    ]
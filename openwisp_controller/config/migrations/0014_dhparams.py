@@ -0,0 +1,30 @@
+# Generated by Django 2.0.2 on 2018-04-12 16:40
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0013_config_checksum_db'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DhParams',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified')),
+                ('length', models.PositiveIntegerField(db_index=True, verbose_name='length')),
+                ('dh', models.TextField(verbose_name='Diffie-Hellman parameters')),
+            ],
+            options={
+                'verbose_name': 'Diffie-Hellman parameters',
+                'verbose_name_plural': 'Diffie-Hellman parameters',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.0.2 on 2018-04-20 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0014_dhparams'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['-created'], name='device_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['organization', '-created'], name='device_org_created_idx'),
+        ),
+    ]
@@ -1,9 +1,12 @@
+import json
 import uuid
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
+from django_netjsonconfig import settings as django_netjsonconfig_settings
 from django_netjsonconfig.base.config import AbstractConfig, TemplatesThrough
 from django_netjsonconfig.base.config import TemplatesVpnMixin as BaseMixin
 from django_netjsonconfig.base.device import AbstractDevice
@@ -16,7 +19,15 @@ from sortedm2m.fields import SortedManyToManyField
 from taggit.managers import TaggableManager
 
 from openwisp_users.mixins import OrgMixin, ShareableOrgMixin
-
+from openwisp_utils.base import TimeStampedEditableModel
+
+from ..pki.models import Cert
+from ..tasks import defer, is_async
+from . import settings as app_settings
+from . import tasks
+from .cache import (get_merged_templates, invalidate_device_auth, invalidate_registration_settings,
+                    invalidate_templates)
+from .signals import configs_modified
 from .utils import get_default_templates_queryset
 
 
@@ -29,39 +40,56 @@ class TemplatesVpnMixin(BaseMixin):
         queryset = super(TemplatesVpnMixin, self).get_default_templates()
         return get_default_templates_queryset(self.organization_id, queryset=queryset)
 
+    def get_backend_instance(self, template_instances=None):
+        """
+        templates are merged once for each distinct set of
+        templates, see ``openwisp_controller.config.cache.get_merged_templates``
+        """
+        backend = self.backend_class
+        if template_instances is None:
+            # configurations of templates are loaded only
+            # if the merged templates are not cached
+            template_instances = self.templates.only('id', 'modified')
+        kwargs = {'config': self.get_config(),
+                  'context': self.get_context()}
+        merged_templates = get_merged_templates(backend, list(template_instances))
+        if merged_templates is not None:
+            kwargs['templates'] = [merged_templates]
+        return backend(**kwargs)
+
     @classmethod
     def clean_templates_org(cls, action, instance, pk_set, **kwargs):
+        """
+        ensures templates are either shared or owned by the organization
+        of ``instance``, returns the list of templates (loaded with a single
+        query when coming from signals, not loaded again when coming from the admin)
+        """
         templates = cls.get_templates_from_pk_set(action, pk_set)
         if not templates:
             return templates
-        # when using the admin, templates will be a list
-        # we need to get the queryset from this list in order to proceed
-        if not isinstance(templates, models.QuerySet):
-            template_model = cls.templates.rel.model
-            pk_list = [template.pk for template in templates]
-            templates = template_model.objects.filter(pk__in=pk_list)
-        # lookg for invalid templates
-        invalids = templates.exclude(organization=instance.organization)\
-                            .exclude(organization=None)\
-                            .values('name')
-        if templates and invalids:
-            names = ''
-            for invalid in invalids:
-                names = '{0}, {1}'.format(names, invalid['name'])
-            names = names[2:]
+        # when coming from signals templates will be a queryset,
+        # evaluate it once and reuse the instances in the following operations
+        templates = list(templates)
+        invalids = [template.name for template in templates
+                    if template.organization_id not in [None, instance.organization_id]]
+        if invalids:
             message = _('The following templates are owned by organizations '
                         'which do not match the organization of this '
-                        'configuration: {0}').format(names)
+                        'configuration: {0}').format(', '.join(invalids))
             raise ValidationError(message)
-        # return valid templates in order to save computation
-        # in the following operations
         return templates
 
     @classmethod
     def clean_templates(cls, action, instance, pk_set, **kwargs):
         """
-        adds organization validation
+        adds organization validation, templates which have
+        already been validated by ``ConfigForm`` are not validated again
         """
+        validated = getattr(instance, '_validated_templates', None)
+        if action == 'pre_add' and validated is not None and isinstance(pk_set, set):
+            del instance._validated_templates
+            if pk_set <= validated:
+                return
         templates = cls.clean_templates_org(action, instance, pk_set, **kwargs)
         # perform validation of configuration (local config + templates)
         super(TemplatesVpnMixin, cls).clean_templates(action, instance, templates, **kwargs)
@@ -73,6 +101,40 @@ class Device(OrgMixin, AbstractDevice):
     """
     class Meta(AbstractDevice.Meta):
         abstract = False
+        # the device list of the admin is sorted by creation date,
+        # operators see only the devices of their organizations
+        indexes = [
+            models.Index(fields=['-created'], name='device_created_idx'),
+            models.Index(fields=['organization', '-created'], name='device_org_created_idx'),
+        ]
+
+    @classmethod
+    def post_save(cls, instance, created, **kwargs):
+        """
+        class method for ``post_save`` signal
+        device attributes are part of the configuration
+        context, therefore the stored checksum is invalidated;
+        the cached authentication data is invalidated too
+        """
+        invalidate_device_auth(instance.pk)
+        if not created:
+            Config.invalidate_checksum_db(device=instance)
+
+    @classmethod
+    def post_delete(cls, instance, **kwargs):
+        """
+        class method for ``post_delete`` signal
+        """
+        invalidate_device_auth(instance.pk)
+
+    @classmethod
+    def organization_post_save(cls, instance, **kwargs):
+        """
+        class method for ``post_save`` signal of ``Organization``
+        (devices of inactive organizations cannot be authenticated)
+        """
+        pk_list = cls.objects.filter(organization=instance).values_list('pk', flat=True)
+        invalidate_device_auth(*pk_list)
 
 
 class Config(OrgMixin, TemplatesVpnMixin, AbstractConfig):
@@ -91,6 +153,13 @@ class Config(OrgMixin, TemplatesVpnMixin, AbstractConfig):
                                  through='config.VpnClient',
                                  related_name='vpn_relations',
                                  blank=True)
+    checksum_db = models.CharField(_('configuration checksum'),
+                                   max_length=32,
+                                   blank=True,
+                                   null=True,
+                                   editable=False,
+                                   help_text=_('checksum of the last generated configuration, '
+                                               'reset whenever the configuration changes'))
 
     class Meta(AbstractConfig.Meta):
         abstract = False
@@ -100,6 +169,218 @@ class Config(OrgMixin, TemplatesVpnMixin, AbstractConfig):
             self.organization = self.device.organization
         super(Config, self).clean()
 
+    def save(self, *args, **kwargs):
+        # partial updates (eg: status, last_ip) do not affect the checksum
+        if kwargs.get('update_fields') is None:
+            self.checksum_db = None
+        return super(Config, self).save(*args, **kwargs)
+
+    def _set_status(self, status, save=True):
+        """
+        saves only the fields affected by status changes
+        """
+        self.status = status
+        if save:
+            self.save(update_fields=['status', 'modified'])
+
+    def get_cached_checksum(self):
+        """
+        returns the checksum stored in the database,
+        generates and stores it first if it has been invalidated
+        """
+        if not self.checksum_db:
+            self.update_checksum_db()
+        return self.checksum_db
+
+    def update_checksum_db(self, checksum=None):
+        """
+        stores ``checksum`` (generates it if not supplied) in
+        the database without calling ``save`` (and its side effects);
+        the checksum is not stored if the configuration has been
+        modified or invalidated after this instance was loaded,
+        otherwise a checksum generated from the previous state
+        could overwrite the invalidation
+        """
+        self.checksum_db = checksum or self.checksum
+        self.__class__.objects.filter(pk=self.pk, modified=self.modified) \
+                              .update(checksum_db=self.checksum_db)
+
+    @classmethod
+    def invalidate_checksum_db(cls, **lookup):
+        """
+        resets the stored checksum of the configurations
+        matching ``lookup``, it will be generated again
+        the next time it's requested; ``modified`` is updated
+        too (see ``update_checksum_db``)
+        """
+        cls.objects.filter(**lookup).update(checksum_db=None, modified=timezone.now())
+
+    @classmethod
+    def post_save(cls, instance, created, **kwargs):
+        """
+        class method for ``post_save`` signal,
+        the cached authentication data of the device
+        includes the primary key of its configuration
+        """
+        if created:
+            invalidate_device_auth(instance.device_id)
+
+    @classmethod
+    def post_delete(cls, instance, **kwargs):
+        """
+        class method for ``post_delete`` signal
+        """
+        invalidate_device_auth(instance.device_id)
+
+    @classmethod
+    def config_modified_receiver(cls, config, **kwargs):
+        """
+        class method for ``config_modified`` signal
+        when using an asynchronous task backend, the
+        checksum is generated again in the background
+        """
+        config.checksum_db = None
+        config.modified = timezone.now()
+        cls.objects.filter(pk=config.pk).update(checksum_db=None, modified=config.modified)
+        if is_async():
+            defer(tasks.update_config_checksum, str(config.pk))
+
+    @classmethod
+    def bulk_add_templates(cls, config_templates):
+        """
+        adds templates to many configurations with a single
+        ``bulk_create`` of the m2m relationship objects, expects
+        a list of ``(config, templates)`` tuples; vpn clients of
+        vpn templates are created as ``manage_vpn_clients`` does
+        does NOT validate the resulting configurations, nor sends
+        ``m2m_changed`` and ``config_modified`` signals
+        """
+        through = cls.templates.through
+        field = cls._meta.get_field('templates')
+        sort_field = getattr(field, 'sort_value_field_name', 'sort_value')
+        relations = []
+        vpn_clients = []
+        for config, templates in config_templates:
+            for index, template in enumerate(templates):
+                relations.append(through(**{'config_id': config.pk,
+                                            'template_id': template.pk,
+                                            sort_field: index}))
+                if template.type == 'vpn':
+                    vpn_clients.append(cls.vpn.through(config=config,
+                                                       vpn=template.vpn,
+                                                       auto_cert=template.auto_cert))
+        through.objects.bulk_create(relations)
+        for client in vpn_clients:
+            client.full_clean()
+            client.save()
+
+    @classmethod
+    def bulk_assign_template(cls, template, configs):
+        """
+        appends ``template`` to the templates of ``configs`` (a queryset),
+        configurations which already use it are skipped; the resulting
+        configuration is validated once for each group of configurations
+        sharing backend, configuration and templates, relationships and
+        vpn clients are created in bulk and the configurations are flagged
+        as modified (see ``bulk_set_status_modified``); returns the list
+        of updated configurations and a list of ``(config, error)`` tuples
+        for the configurations which have not been updated
+        """
+        through = cls.templates.through
+        field = cls._meta.get_field('templates')
+        sort_field = getattr(field, 'sort_value_field_name', 'sort_value')
+        queryset = configs.exclude(templates=template)
+        # current templates of each configuration, in order
+        relations = through.objects.filter(config__in=queryset) \
+                                   .order_by(sort_field) \
+                                   .values_list('config_id', 'template_id', sort_field)
+        current = {}
+        sort_values = {}
+        for config_id, template_id, sort_value in relations:
+            current.setdefault(config_id, []).append(template_id)
+            sort_values[config_id] = sort_value
+        template_pks = set(pk for pks in current.values() for pk in pks)
+        templates = cls.get_template_model().objects.in_bulk(list(template_pks))
+        groups = {}
+        invalid = []
+        for config in queryset:
+            if config.backend != template.backend:
+                invalid.append((config, _('The backend of the template does not '
+                                          'match the backend of this configuration')))
+                continue
+            if template.organization_id not in [None, config.organization_id]:
+                invalid.append((config, _('The following templates are owned by organizations '
+                                          'which do not match the organization of this '
+                                          'configuration: {0}').format(template.name)))
+                continue
+            key = (config.backend,
+                   json.dumps(config.config, sort_keys=True),
+                   tuple(current.get(config.pk, [])))
+            groups.setdefault(key, []).append(config)
+        # validates one configuration of each group
+        assigned = []
+        for key, group in groups.items():
+            instances = [templates[pk] for pk in key[2]] + [template]
+            backend = group[0].get_backend_instance(template_instances=instances)
+            try:
+                cls.clean_netjsonconfig_backend(backend)
+            except ValidationError as e:
+                message = _('There is a conflict with the specified templates. {0}')
+                invalid += [(config, message.format(e.message)) for config in group]
+            else:
+                assigned += group
+        if not assigned:
+            return assigned, invalid
+        pk_list = [config.pk for config in assigned]
+        new_relations = [through(**{'config_id': pk,
+                                    'template_id': template.pk,
+                                    sort_field: sort_values.get(pk, -1) + 1}) for pk in pk_list]
+        vpn_client_model = cls.vpn.through
+        clients = vpn_client_model.objects.filter(vpn=template.vpn_id, config__in=configs)
+        created = set()
+        if template.type == 'vpn':
+            # configurations may be already connected to the vpn by other templates
+            created = set(pk_list) - set(clients.values_list('config_id', flat=True))
+        with transaction.atomic():
+            through.objects.bulk_create(new_relations)
+            vpn_client_model.objects.bulk_create([
+                vpn_client_model(config_id=pk, vpn_id=template.vpn_id, auto_cert=template.auto_cert)
+                for pk in created
+            ])
+            cls.bulk_set_status_modified(pk_list)
+        if created and template.auto_cert:
+            # certificates are created by one task for each chunk of
+            # clients, configurations are not rendered in the meantime
+            pending = clients.filter(auto_cert=True, cert=None).values_list('pk', 'config_id')
+            pk_list = [str(pk) for pk, config_id in pending if config_id in created]
+            chunk_size = app_settings.CONFIG_MODIFIED_CHUNK_SIZE
+            for start in range(0, len(pk_list), chunk_size):
+                defer(tasks.create_vpnclient_certs, *pk_list[start:start + chunk_size])
+        return assigned, invalid
+
+    @classmethod
+    def bulk_set_status_modified(cls, pk_list, template=None):
+        """
+        flags the configurations in ``pk_list`` as modified and invalidates
+        their checksum with one query for each chunk of configurations,
+        ``configs_modified`` is sent once for each chunk
+        """
+        chunk_size = app_settings.CONFIG_MODIFIED_CHUNK_SIZE
+        for start in range(0, len(pk_list), chunk_size):
+            chunk = pk_list[start:start + chunk_size]
+            cls.objects.filter(pk__in=chunk).update(status='modified',
+                                                    checksum_db=None,
+                                                    modified=timezone.now())
+            configs_modified.send(sender=cls, pk_list=chunk, template=template)
+
+    @classmethod
+    def configs_modified_receiver(cls, pk_list, **kwargs):
+        """
+        class method for ``configs_modified`` signal
+        (connected only when using an asynchronous task backend)
+        """
+        defer(tasks.update_config_checksum, *[str(pk) for pk in pk_list])
+
 
 class TemplateTag(AbstractTemplateTag):
     """
@@ -142,6 +423,43 @@ class Template(ShareableOrgMixin, AbstractTemplate):
         self._validate_org_relation('vpn')
         super(Template, self).clean()
 
+    @classmethod
+    def post_save(cls, **kwargs):
+        """
+        class method for ``post_save`` and ``post_delete`` signals
+        of ``Template`` and for ``post_save`` of ``Organization``
+        (inactive organizations do not have default templates),
+        invalidates cached default templates and filter choices
+        """
+        invalidate_templates()
+
+    def _update_related_config_status(self):
+        defer(tasks.update_related_config_status, str(self.pk))
+
+    def update_related_config_status(self):
+        """
+        flags related configurations as modified with a single query;
+        ``configs_modified`` is then sent once for each chunk of
+        configurations, unless ``CONFIG_MODIFIED_PER_DEVICE`` is ``True``,
+        in which case ``config_modified`` is sent for each configuration
+        """
+        configs = self.config_relations.all()
+        # bumps ``modified``, status reports buffered before
+        # this change are discarded (see ``StatusBuffer``)
+        configs.update(status='modified', checksum_db=None, modified=timezone.now())
+        if app_settings.CONFIG_MODIFIED_PER_DEVICE:
+            for config in configs.select_related('device'):
+                config._send_config_modified_signal()
+            return
+        if not configs_modified.has_listeners(configs.model):
+            return
+        pk_list = list(configs.values_list('pk', flat=True))
+        chunk_size = app_settings.CONFIG_MODIFIED_CHUNK_SIZE
+        for start in range(0, len(pk_list), chunk_size):
+            configs_modified.send(sender=configs.model,
+                                  pk_list=pk_list[start:start + chunk_size],
+                                  template=self)
+
 
 class Vpn(ShareableOrgMixin, AbstractVpn):
     """
@@ -164,6 +482,68 @@ class Vpn(ShareableOrgMixin, AbstractVpn):
         self._validate_org_relation('ca')
         self._validate_org_relation('cert')
 
+    def save(self, *args, **kwargs):
+        """
+        takes DH parameters from the pool if available
+        (see ``DhParams``), falls back to generating them
+        """
+        if not self.dh:
+            self.dh = DhParams.pop(app_settings.DH_LENGTH) or self.dhparam(app_settings.DH_LENGTH)
+        super(Vpn, self).save(*args, **kwargs)
+
+    @classmethod
+    def post_save(cls, instance, created, **kwargs):
+        """
+        class method for ``post_save`` signal
+        the VPN server (host, CA, certificate) is part of the
+        configuration context of its clients, therefore
+        their stored checksum is invalidated
+        """
+        if not created:
+            Config.invalidate_checksum_db(vpn=instance)
+
+    @classmethod
+    def ca_post_save(cls, instance, created, **kwargs):
+        """
+        class method for ``post_save`` signal of ``Ca``
+        (eg: renewal), see ``post_save``
+        """
+        if not created:
+            Config.invalidate_checksum_db(vpn__ca=instance)
+
+    @classmethod
+    def cert_post_save(cls, instance, created, **kwargs):
+        """
+        class method for ``post_save`` signal of ``Cert``, both
+        server and client certificates are part of the context
+        """
+        if not created:
+            Config.invalidate_checksum_db(vpn__cert=instance)
+            Config.invalidate_checksum_db(vpnclient__cert=instance)
+
+    def reissue_client_certs(self):
+        """
+        rotates the certificates created automatically for the clients
+        of this VPN: the old certificates are revoked in bulk (see
+        ``Cert.bulk_revoke``), new ones are created and the configurations
+        involved are flagged as modified; returns the number of clients
+        """
+        clients = list(self.vpnclient_set.filter(auto_cert=True)
+                                         .select_related('config__device'))
+        if not clients:
+            return 0
+        cert_pks = [client.cert_id for client in clients if client.cert_id]
+        with transaction.atomic():
+            Cert.bulk_revoke(Cert.objects.filter(pk__in=cert_pks))
+            for client in clients:
+                client.vpn = self
+                device = client.config.device
+                cn = django_netjsonconfig_settings.COMMON_NAME_FORMAT.format(**device.__dict__)
+                cert = client._auto_create_cert(name=device.name, common_name=cn)
+                VpnClient.objects.filter(pk=client.pk).update(cert=cert)
+        Config.bulk_set_status_modified([client.config_id for client in clients])
+        return len(clients)
+
     def _auto_create_cert_extra(self, cert):
         """
         sets the organization on the server certificate
@@ -188,6 +568,34 @@ class VpnClient(AbstractVpnClient):
     class Meta(AbstractVpnClient.Meta):
         abstract = False
 
+    def save(self, *args, **kwargs):
+        """
+        when using an asynchronous task backend, the
+        client certificate is created in the background
+        """
+        if not self.auto_cert or self.cert_id or not is_async():
+            return super(VpnClient, self).save(*args, **kwargs)
+        # skips AbstractVpnClient.save
+        super(AbstractVpnClient, self).save(*args, **kwargs)
+        defer(tasks.create_vpnclient_cert, str(self.pk))
+
+    @classmethod
+    def post_save(cls, instance, **kwargs):
+        """
+        class method for ``post_save`` signal
+        VPN certificates are part of the configuration
+        context, therefore the stored checksum is invalidated
+        """
+        Config.invalidate_checksum_db(pk=instance.config_id)
+
+    @classmethod
+    def post_delete(cls, **kwargs):
+        instance = kwargs['instance']
+        # certificate may not have been created yet
+        if instance.cert_id:
+            super(VpnClient, cls).post_delete(**kwargs)
+        Config.invalidate_checksum_db(pk=instance.config_id)
+
     def _auto_create_cert_extra(self, cert):
         """
         sets the organization on the created client certificate
@@ -225,3 +633,76 @@ class OrganizationConfigSettings(models.Model):
 
     def __str__(self):
         return self.organization.name
+
+    @classmethod
+    def pre_save(cls, instance, **kwargs):
+        """
+        class method for ``pre_save`` signal
+        stores the current shared secret
+        in order to invalidate its cache later
+        """
+        if instance._state.adding:
+            return
+        instance._previous_shared_secret = cls.objects.filter(pk=instance.pk) \
+                                                      .values_list('shared_secret', flat=True) \
+                                                      .first()
+
+    @classmethod
+    def post_save(cls, instance, **kwargs):
+        """
+        class method for ``post_save`` and ``post_delete`` signals
+        """
+        invalidate_registration_settings(instance.shared_secret,
+                                         getattr(instance, '_previous_shared_secret', None))
+
+    @classmethod
+    def organization_post_save(cls, instance, **kwargs):
+        """
+        class method for ``post_save`` signal of ``Organization``
+        """
+        secrets = cls.objects.filter(organization=instance) \
+                             .values_list('shared_secret', flat=True)
+        invalidate_registration_settings(*secrets)
+
+
+class DhParams(TimeStampedEditableModel):
+    """
+    pool of pre-generated Diffie-Hellman parameters used by new
+    ``Vpn`` objects, filled by the ``filldhparams`` management command
+    """
+    length = models.PositiveIntegerField(_('length'), db_index=True)
+    dh = models.TextField(_('Diffie-Hellman parameters'))
+
+    class Meta:
+        verbose_name = _('Diffie-Hellman parameters')
+        verbose_name_plural = verbose_name
+
+    @classmethod
+    def pop(cls, length):
+        """
+        removes a set of parameters of ``length`` bits
+        from the pool and returns it, ``None`` if the pool is empty
+        """
+        while True:
+            params = cls.objects.filter(length=length) \
+                                .order_by('created') \
+                                .values_list('pk', 'dh') \
+                                .first()
+            if params is None:
+                return None
+            # parameters taken concurrently by another process are skipped
+            if cls.objects.filter(pk=params[0]).delete()[0]:
+                return params[1]
+
+    @classmethod
+    def get_pool_depth(cls):
+        """
+        returns a dictionary which maps each length
+        to the number of parameters in the pool
+        """
+        depth = {length: 0 for length in app_settings.DH_POOL}
+        queryset = cls.objects.values_list('length') \
+                              .annotate(count=models.Count('pk')) \
+                              .order_by()
+        depth.update(dict(queryset))
+        return depth
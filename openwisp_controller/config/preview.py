@@ -0,0 +1,98 @@
+"""
+Rendering of the configuration previews of the admin
+
+Previews are rendered in a bounded pool of threads with a timeout,
+so that slow configurations (eg: templates with hundreds of interfaces
+or firewall rules) cannot block the workers serving the admin; results
+are cached by a hash of the backend and of the configuration merged
+with templates and variables, hence repeated previews are not rendered again.
+"""
+import hashlib
+import json
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from . import settings as app_settings
+
+_pool = {}
+
+
+def get_preview_pool():
+    size = app_settings.PREVIEW_WORKERS
+    if size not in _pool:
+        _pool[size] = ThreadPool(size)
+    return _pool[size]
+
+
+def get_preview_cache_key(backend):
+    path = '{0}.{1}'.format(backend.__class__.__module__, backend.__class__.__name__)
+    data = json.dumps([path, backend.config], sort_keys=True, default=str)
+    return 'openwisp_controller.preview.{0}'.format(hashlib.sha256(data.encode('utf8')).hexdigest())
+
+
+def _render(instance, backend):
+    try:
+        instance.clean_netjsonconfig_backend(backend)
+        return backend.render(), None
+    except ValidationError as e:
+        return None, e.message
+
+
+def render_preview(instance, backend):
+    """
+    validates and renders ``backend`` (see ``get_backend_instance``)
+    in the preview pool, returns a tuple containing the output and
+    the error message (one of them is ``None``); validation errors
+    are cached too, timeouts are not
+    """
+    key = get_preview_cache_key(backend)
+    result = cache.get(key)
+    if result is not None:
+        return result
+    task = get_preview_pool().apply_async(_render, (instance, backend))
+    try:
+        result = task.get(app_settings.PREVIEW_TIMEOUT)
+    except TimeoutError:
+        # the thread cannot be interrupted, its result will be discarded
+        return None, 'Preview timed out after {0} seconds'.format(app_settings.PREVIEW_TIMEOUT)
+    cache.set(key, result, app_settings.PREVIEW_CACHE_TIMEOUT)
+    return result
+
+
+class PreviewInstance(object):
+    """
+    wraps the instance previewed by the admin (see
+    ``PreviewMixin``), its backend is validated and rendered
+    when ``render`` is called (see ``render_preview``)
+    """
+    def __init__(self, instance):
+        self._instance = instance
+
+    def __getattr__(self, name):
+        return getattr(self._instance, name)
+
+    def get_backend_instance(self, template_instances=None):
+        backend = self._instance.get_backend_instance(template_instances=template_instances)
+        return PreviewBackend(self._instance, backend)
+
+    def clean_netjsonconfig_backend(self, backend):
+        # validation is performed by render_preview
+        pass
+
+
+class PreviewBackend(object):
+    def __init__(self, instance, backend):
+        self._instance = instance
+        self._backend = backend
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    def render(self):
+        output, error = render_preview(self._instance, self._backend)
+        if error is not None:
+            raise ValidationError(error)
+        return output
@@ -0,0 +1,27 @@
+from django.conf import settings
+
+CONFIG_ARCHIVE_ROOT = getattr(settings, 'OPENWISP_CONTROLLER_CONFIG_ARCHIVE_ROOT', None)
+CONFIG_ARCHIVE_STORAGE = getattr(settings, 'OPENWISP_CONTROLLER_CONFIG_ARCHIVE_STORAGE',
+                                 'django.core.files.storage.FileSystemStorage')
+CONFIG_MODIFIED_PER_DEVICE = getattr(settings, 'OPENWISP_CONTROLLER_CONFIG_MODIFIED_PER_DEVICE', False)
+CONFIG_MODIFIED_CHUNK_SIZE = getattr(settings, 'OPENWISP_CONTROLLER_CONFIG_MODIFIED_CHUNK_SIZE', 1000)
+TASK_BACKEND = getattr(settings, 'OPENWISP_CONTROLLER_TASK_BACKEND', 'openwisp_controller.tasks.SyncBackend')
+TASK_THREADS = getattr(settings, 'OPENWISP_CONTROLLER_TASK_THREADS', 4)
+LOCAL_CACHE_TIMEOUT = getattr(settings, 'OPENWISP_CONTROLLER_LOCAL_CACHE_TIMEOUT', 10)
+REGISTRATION_CACHE_TIMEOUT = getattr(settings, 'OPENWISP_CONTROLLER_REGISTRATION_CACHE_TIMEOUT', 3600)
+REGISTRATION_NEGATIVE_CACHE_TIMEOUT = getattr(settings,
+                                              'OPENWISP_CONTROLLER_REGISTRATION_NEGATIVE_CACHE_TIMEOUT',
+                                              60)
+BULK_REGISTRATION_MAX_DEVICES = getattr(settings, 'OPENWISP_CONTROLLER_BULK_REGISTRATION_MAX_DEVICES', 1000)
+MERGED_TEMPLATES_CACHE_SIZE = getattr(settings, 'OPENWISP_CONTROLLER_MERGED_TEMPLATES_CACHE_SIZE', 100)
+DEVICE_AUTH_CACHE_TIMEOUT = getattr(settings, 'OPENWISP_CONTROLLER_DEVICE_AUTH_CACHE_TIMEOUT', 300)
+STATUS_FLUSH_INTERVAL = getattr(settings, 'OPENWISP_CONTROLLER_STATUS_FLUSH_INTERVAL', 0)
+DH_LENGTH = getattr(settings, 'OPENWISP_CONTROLLER_DH_LENGTH', 1024)
+DH_POOL = getattr(settings, 'OPENWISP_CONTROLLER_DH_POOL', {DH_LENGTH: 5})
+TEMPLATES_CACHE_TIMEOUT = getattr(settings, 'OPENWISP_CONTROLLER_TEMPLATES_CACHE_TIMEOUT', 60 * 60)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = getattr(settings,
+                                          'OPENWISP_CONTROLLER_ADMIN_ESTIMATED_COUNT_THRESHOLD',
+                                          10000)
+PREVIEW_CACHE_TIMEOUT = getattr(settings, 'OPENWISP_CONTROLLER_PREVIEW_CACHE_TIMEOUT', 60 * 60)
+PREVIEW_TIMEOUT = getattr(settings, 'OPENWISP_CONTROLLER_PREVIEW_TIMEOUT', 10)
+PREVIEW_WORKERS = getattr(settings, 'OPENWISP_CONTROLLER_PREVIEW_WORKERS', 4)
@@ -0,0 +1,3 @@
+from django.dispatch import Signal
+
+configs_modified = Signal(providing_args=['pk_list', 'template'])
@@ -0,0 +1,131 @@
+"""
+Write-behind handling of the status reported by devices
+
+When ``OPENWISP_CONTROLLER_STATUS_FLUSH_INTERVAL`` is greater than zero,
+``running`` reports are collected in a per-process buffer (repeated reports
+of the same device are collapsed) and written periodically with one bulk
+``UPDATE`` for each chunk of configurations; other statuses (eg: ``error``)
+are always written immediately.
+"""
+import atexit
+import logging
+import threading
+import time
+from functools import reduce
+from operator import or_
+
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from . import settings as app_settings
+
+logger = logging.getLogger(__name__)
+BUFFERED_STATUSES = ['running']
+
+
+class StatusBuffer(object):
+    """
+    collects pending status changes of configurations and flushes
+    them every ``interval`` seconds (or when ``max_size`` is reached)
+    in a daemon thread started when the first change is added
+    """
+    chunk_size = 500
+
+    def __init__(self, interval, max_size=1000):
+        self.interval = interval
+        self.max_size = max_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, config, status):
+        """
+        stores the status of ``config``, the change is written only
+        if the configuration is not modified in the meantime
+        """
+        with self._lock:
+            self._pending[config.pk] = (status, config.modified)
+            full = len(self._pending) >= self.max_size
+            self._start()
+        if full:
+            self.flush()
+
+    def discard(self, pk):
+        with self._lock:
+            self._pending.pop(pk, None)
+
+    def flush(self):
+        """
+        writes pending changes with a bulk ``UPDATE``
+        for each status and chunk of configurations
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        from .models import Config
+        grouped = {}
+        for pk, (status, modified) in pending.items():
+            grouped.setdefault(status, []).append(Q(pk=pk, modified=modified))
+        now = timezone.now()
+        for status, lookups in grouped.items():
+            for i in range(0, len(lookups), self.chunk_size):
+                lookup = reduce(or_, lookups[i:i + self.chunk_size])
+                Config.objects.filter(lookup).update(status=status, modified=now)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name='openwisp-controller-status')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flush of status changes failed')
+            finally:
+                close_old_connections()
+
+
+_buffer = {}
+
+
+def get_status_buffer():
+    """
+    returns the status buffer of the current process,
+    ``None`` if ``OPENWISP_CONTROLLER_STATUS_FLUSH_INTERVAL`` is zero
+    """
+    interval = app_settings.STATUS_FLUSH_INTERVAL
+    if not interval:
+        return None
+    if interval not in _buffer:
+        _buffer[interval] = StatusBuffer(interval)
+        atexit.register(_buffer[interval].flush)
+    return _buffer[interval]
+
+
+def update_status(config, status):
+    """
+    sets the status reported by a device, the write is skipped if the
+    status is not changed, ``running`` is buffered if the buffer is enabled
+    """
+    status_buffer = get_status_buffer()
+    if status_buffer is not None and status not in BUFFERED_STATUSES:
+        # a pending change would overwrite this one
+        status_buffer.discard(config.pk)
+    if config.status == status:
+        return
+    if status_buffer is not None and status in BUFFERED_STATUSES:
+        status_buffer.add(config, status)
+        config.status = status
+        return
+    getattr(config, 'set_status_{0}'.format(status))()
@@ -0,0 +1,75 @@
+"""
+tasks executed through ``openwisp_controller.tasks.defer``
+"""
+from django_netjsonconfig import settings as django_netjsonconfig_settings
+
+from .archives import get_archive_store
+
+
+def update_related_config_status(template_pk):
+    from .models import Template
+    try:
+        template = Template.objects.get(pk=template_pk)
+    except Template.DoesNotExist:
+        return
+    template.update_related_config_status()
+
+
+def update_config_checksum(*config_pks):
+    """
+    generates and stores the checksum (and the archive,
+    if the archive store is enabled) of each configuration
+    """
+    from .models import Config
+    store = get_archive_store()
+    for config in Config.objects.filter(pk__in=config_pks).select_related('device'):
+        if store:
+            store.save(config)
+        else:
+            config.update_checksum_db()
+
+
+def _create_vpnclient_cert(client):
+    from .models import VpnClient
+    device = client.config.device
+    cn = django_netjsonconfig_settings.COMMON_NAME_FORMAT.format(**device.__dict__)
+    cert = client._auto_create_cert(name=device.name, common_name=cn)
+    VpnClient.objects.filter(pk=client.pk).update(cert=cert)
+
+
+def create_vpnclient_cert(vpnclient_pk):
+    from .models import Config, VpnClient
+    try:
+        client = VpnClient.objects.select_related('config__device', 'vpn__ca') \
+                                  .get(pk=vpnclient_pk)
+    except VpnClient.DoesNotExist:
+        return
+    if client.cert_id:
+        return
+    _create_vpnclient_cert(client)
+    Config.invalidate_checksum_db(pk=client.config_id)
+    update_config_checksum(client.config_id)
+
+
+def create_vpnclient_certs(*vpnclient_pks):
+    """
+    creates the certificates of many vpn clients, the stored
+    checksums are reset and generated again when requested
+    """
+    from .models import Config, VpnClient
+    clients = VpnClient.objects.filter(pk__in=vpnclient_pks, cert=None) \
+                               .select_related('config__device', 'vpn__ca')
+    config_pks = []
+    for client in clients:
+        _create_vpnclient_cert(client)
+        config_pks.append(client.config_id)
+    Config.objects.filter(pk__in=config_pks).update(checksum_db=None)
+
+
+def reissue_vpn_client_certs(vpn_pk):
+    from .models import Vpn
+    try:
+        vpn = Vpn.objects.select_related('ca').get(pk=vpn_pk)
+    except Vpn.DoesNotExist:
+        return
+    vpn.reissue_client_certs()
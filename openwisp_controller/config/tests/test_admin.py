@@ -1,5 +1,6 @@
 import json
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 
@@ -8,7 +9,9 @@ from openwisp_users.tests.utils import TestOrganizationMixin
 from . import CreateConfigTemplateMixin, TestVpnX509Mixin
 from ...pki.models import Ca, Cert
 from ...tests.utils import TestAdminMixin
+from ..admin import ConfigForm, DevicePaginator
 from ..models import Config, Device, Template, Vpn
+from ..preview import get_preview_cache_key, render_preview
 
 
 class TestAdmin(CreateConfigTemplateMixin, TestAdminMixin,
@@ -127,6 +130,33 @@ class TestAdmin(CreateConfigTemplateMixin, TestAdminMixin,
         self.assertContains(response, 'eth0')
         self.assertContains(response, 'dhcp')
 
+    def test_preview_cached(self):
+        config = self._create_config(organization=self._create_org())
+        backend = config.get_backend_instance()
+        key = get_preview_cache_key(backend)
+        self.assertIsNone(cache.get(key))
+        output, error = render_preview(config, backend)
+        self.assertIsNone(error)
+        self.assertIsNotNone(output)
+        self.assertEqual(cache.get(key), (output, error))
+        # the same configuration is not rendered again
+        cache.set(key, ('cached', None))
+        self.assertEqual(render_preview(config, config.get_backend_instance()), ('cached', None))
+        # changes of the configuration produce a different key
+        config.config = {'general': {'hostname': 'changed'}}
+        self.assertNotEqual(get_preview_cache_key(config.get_backend_instance()), key)
+
+    def test_config_form_validated_templates_cleared(self):
+        org = self._create_org()
+        template = self._create_template(organization=org)
+        config = self._create_config(organization=org)
+        form = ConfigForm(instance=config)
+        # no template is added when saving
+        form.cleaned_data = {}
+        config._validated_templates = set([template.pk])
+        form._save_m2m()
+        self.assertFalse(hasattr(config, '_validated_templates'))
+
     def test_device_preview_button(self):
         config = self._create_config(organization=self._create_org())
         path = reverse('admin:config_device_change', args=[config.device.pk])
@@ -199,6 +229,44 @@ class TestAdmin(CreateConfigTemplateMixin, TestAdminMixin,
                     data['c3_inactive'].name]
         )
 
+    def test_device_templates_filter_cache(self):
+        self._create_multitenancy_test_env()
+        self._login()
+        url = reverse('admin:config_device_changelist')
+        response = self.client.get(url)
+        self.assertNotContains(response, 'new-template')
+        # new templates invalidate the cached choices
+        self._create_template(name='new-template')
+        response = self.client.get(url)
+        self.assertContains(response, 'new-template')
+
+    def test_device_changelist_paginator(self):
+        data = self._create_multitenancy_test_env()
+        paginator = DevicePaginator(Device.objects.order_by('-created'), 100)
+        self.assertEqual(paginator.count, Device.objects.count())
+        paginator = DevicePaginator(Device.objects.filter(organization=data['org1']), 100)
+        self.assertEqual(paginator.count, 1)
+
+    def test_device_assign_template_action(self):
+        data = self._create_multitenancy_test_env()
+        t_shared = self._create_template(name='t-shared', organization=None)
+        self._login()
+        path = reverse('admin:config_device_changelist')
+        post_data = {'action': 'assign_template_action',
+                     '_selected_action': [data['c1'].device.pk, data['c2'].device.pk]}
+        response = self.client.post(path, post_data)
+        self.assertContains(response, 'configurations of 2 devices')
+        self.assertContains(response, 't-shared')
+        post_data.update({'apply': 'yes', 'template': t_shared.pk})
+        response = self.client.post(path, post_data, follow=True)
+        self.assertContains(response, 'The template was assigned to 2 devices.')
+        self.assertEqual(Config.objects.filter(templates=t_shared).count(), 2)
+        # templates of other organizations are not assigned
+        post_data['template'] = data['t1'].pk
+        response = self.client.post(path, post_data, follow=True)
+        self.assertContains(response, 'The template was assigned to 0 devices.')
+        self.assertContains(response, 'do not match the organization')
+
     def test_device_organization_fk_queryset(self):
         data = self._create_multitenancy_test_env()
         self._test_multitenant_admin(
@@ -309,6 +377,8 @@ class TestAdmin(CreateConfigTemplateMixin, TestAdminMixin,
         self._login()
         response = self.client.get(path)
         self.assertContains(response, '// enable default templates')
+        url = reverse('config:get_default_templates', args=['00000000-0000-0000-0000-000000000000'])
+        self.assertContains(response, url)
 
     def test_template_not_contains_default_templates_js(self):
         template = self._create_template()
@@ -1,9 +1,12 @@
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from openwisp_users.tests.utils import TestOrganizationMixin
 
 from . import CreateConfigTemplateMixin, TestVpnX509Mixin
+from ..cache import _merged_templates_cache
 from ..models import Config, Device, Template
 
 
@@ -48,3 +51,117 @@ class TestConfig(CreateConfigTemplateMixin, TestVpnX509Mixin,
             self.assertIn('do not match the organization', e.messages[0])
         else:
             self.fail('ValidationError not raised')
+
+    def test_config_and_templates_different_organization(self):
+        org1 = self._create_org()
+        org2 = self._create_org(name='test org2', slug='test-org2')
+        t1 = self._create_template(name='t1', organization=org1)
+        t2 = self._create_template(name='t2', organization=org2)
+        t3 = self._create_template(name='t3')
+        config = self._create_config(organization=org2)
+        try:
+            # sortedm2m adds templates without a savepoint
+            with transaction.atomic():
+                config.templates.add(t1, t2, t3)
+        except ValidationError as e:
+            self.assertIn('configuration: t1', e.messages[0])
+        else:
+            self.fail('ValidationError not raised')
+        self.assertEqual(config.templates.count(), 0)
+
+    def _count_add_templates_queries(self, org, count):
+        templates = [self._create_template(name='t{0}-{1}'.format(count, i),
+                                           organization=org)
+                     for i in range(count)]
+        device = self._create_device(name='device-{0}'.format(count),
+                                     mac_address='00:11:22:33:{0:02x}:00'.format(count),
+                                     organization=org)
+        config = self._create_config(organization=org, device=device)
+        with CaptureQueriesContext(connection) as context:
+            config.templates.add(*templates)
+        self.assertEqual(config.templates.count(), count)
+        return len(context)
+
+    def test_add_templates_queries(self):
+        org = self._create_org()
+        queries = [self._count_add_templates_queries(org, count)
+                   for count in [1, 10, 100]]
+        # the number of queries does not depend on the number of templates
+        self.assertEqual(queries[1], queries[0])
+        self.assertEqual(queries[2], queries[0])
+
+    def test_checksum_db(self):
+        org = self._create_org()
+        config = self._create_config(organization=org)
+        self.assertIsNone(config.checksum_db)
+        checksum = config.get_cached_checksum()
+        self.assertEqual(checksum, config.checksum)
+        config.refresh_from_db()
+        self.assertEqual(config.checksum_db, checksum)
+
+    def test_checksum_db_concurrent_invalidation(self):
+        org = self._create_org()
+        config = self._create_config(organization=org)
+        # the configuration is invalidated while its checksum is generated
+        checksum = config.checksum
+        Config.invalidate_checksum_db(pk=config.pk)
+        config.update_checksum_db(checksum)
+        config.refresh_from_db()
+        self.assertIsNone(config.checksum_db)
+        # loaded again after the change
+        config.update_checksum_db()
+        config.refresh_from_db()
+        self.assertIsNotNone(config.checksum_db)
+
+    def test_checksum_db_invalidation(self):
+        org = self._create_org()
+        config = self._create_config(organization=org)
+        template = self._create_template(organization=org)
+        config.templates.add(template)
+        config.get_cached_checksum()
+        # template change
+        template.config['interfaces'][0]['name'] = 'eth1'
+        template.full_clean()
+        template.save()
+        config.refresh_from_db()
+        self.assertIsNone(config.checksum_db)
+        # device change
+        config.get_cached_checksum()
+        config.device.mac_address = '00:11:22:33:44:66'
+        config.device.full_clean()
+        config.device.save()
+        config.refresh_from_db()
+        self.assertIsNone(config.checksum_db)
+        # status changes do not affect the checksum
+        checksum = config.get_cached_checksum()
+        config.set_status_running()
+        config.refresh_from_db()
+        self.assertEqual(config.checksum_db, checksum)
+
+    def test_merged_templates_cache(self):
+        org = self._create_org()
+        t1 = self._create_template(name='t1', organization=org)
+        t2 = self._create_template(name='t2', organization=org, config={
+            'general': {'description': '{{ name }}'}
+        })
+        c1 = self._create_config(organization=org)
+        c1.templates.add(t1, t2)
+        d2 = self._create_device(name='device2', mac_address='00:11:22:33:44:66',
+                                 organization=org)
+        c2 = self._create_config(organization=org, device=d2)
+        c2.templates.add(t1, t2)
+        _merged_templates_cache.clear()
+        hits = _merged_templates_cache.hits
+        self.assertEqual(c1.get_backend_instance().config['general']['description'],
+                         c1.name)
+        self.assertEqual(_merged_templates_cache.hits, hits)
+        # second config with the same templates reuses the merged templates
+        self.assertEqual(c2.get_backend_instance().config['general']['description'],
+                         c2.name)
+        self.assertEqual(_merged_templates_cache.hits, hits + 1)
+        self.assertEqual(c2.get_backend_instance().config['interfaces'][0]['name'], 'eth0')
+        # changing a template changes the cache key
+        t1.config['interfaces'][0]['name'] = 'eth1'
+        t1.full_clean()
+        t1.save()
+        self.assertEqual(c2.get_backend_instance().config['interfaces'][0]['name'], 'eth1')
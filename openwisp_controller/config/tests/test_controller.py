@@ -1,3 +1,8 @@
+import json
+import os
+import shutil
+import tempfile
+
 from django.test import TestCase
 from django.urls import reverse
 from django_netjsonconfig import settings as django_netjsonconfig_settings
@@ -5,12 +10,17 @@ from django_netjsonconfig import settings as django_netjsonconfig_settings
 from openwisp_users.tests.utils import TestOrganizationMixin
 
 from . import CreateConfigTemplateMixin
+from .. import settings as app_settings
+from ..cache import is_shared_cache
 from ..models import Config, Device, OrganizationConfigSettings, Template
+from ..status import get_status_buffer
+from ..utils import get_last_ip_writes
 
 TEST_MACADDR = '00:11:22:33:44:55'
 TEST_MACADDR_NAME = TEST_MACADDR.replace(':', '-')
 TEST_ORG_SHARED_SECRET = 'functional_testing_secret'
 REGISTER_URL = reverse('controller:register')
+REGISTER_BULK_URL = reverse('controller:register_bulk')
 
 
 class TestController(CreateConfigTemplateMixin, TestOrganizationMixin,
@@ -109,6 +119,106 @@ class TestController(CreateConfigTemplateMixin, TestOrganizationMixin,
         })
         self.assertContains(response, 'error: unrecognized secret', status_code=403)
 
+    def test_register_403_cached(self):
+        self._create_org()
+        params = {
+            'secret': 'WRONG',
+            'name': TEST_MACADDR_NAME,
+            'mac_address': TEST_MACADDR,
+            'backend': 'netjsonconfig.OpenWrt'
+        }
+        response = self.client.post(REGISTER_URL, params)
+        self.assertEqual(response.status_code, 403)
+        # unknown secrets are cached too
+        with self.assertNumQueries(0):
+            response = self.client.post(REGISTER_URL, params)
+        self.assertContains(response, 'error: unrecognized secret', status_code=403)
+
+    def test_register_cache_invalidation(self):
+        params = {
+            'secret': 'newsecret',
+            'name': TEST_MACADDR_NAME,
+            'mac_address': TEST_MACADDR,
+            'backend': 'netjsonconfig.OpenWrt'
+        }
+        response = self.client.post(REGISTER_URL, params)
+        self.assertEqual(response.status_code, 403)
+        org = self._create_org(shared_secret='newsecret')
+        response = self.client.post(REGISTER_URL, params)
+        self.assertEqual(response.status_code, 201)
+        org.is_active = False
+        org.save()
+        params['mac_address'] = '00:11:22:33:44:66'
+        params['name'] = '00-11-22-33-44-66'
+        response = self.client.post(REGISTER_URL, params)
+        self.assertContains(response, 'error: unrecognized secret', status_code=403)
+        org.is_active = True
+        org.save()
+        org.config_settings.shared_secret = 'changed'
+        org.config_settings.save()
+        response = self.client.post(REGISTER_URL, params)
+        self.assertContains(response, 'error: unrecognized secret', status_code=403)
+
+    def _register_bulk(self, devices, secret=TEST_ORG_SHARED_SECRET):
+        data = json.dumps({'secret': secret, 'devices': devices})
+        return self.client.post(REGISTER_BULK_URL, data, content_type='application/json')
+
+    def test_register_bulk(self):
+        org = self._create_org()
+        t_default = self._create_template(name='default', default=True, organization=org)
+        t_mesh = self._create_template(name='mesh', organization=org)
+        t_mesh.tags.add('mesh')
+        t_other = self._create_template(name='other', organization=self._create_org(name='org2',
+                                                                                    shared_secret='s2'))
+        t_other.tags.add('mesh')
+        devices = []
+        for i in range(3):
+            devices.append({'name': 'device{0}'.format(i),
+                            'mac_address': '00:11:22:33:44:5{0}'.format(i),
+                            'backend': 'netjsonconfig.OpenWrt',
+                            'tags': 'mesh' if i else ''})
+        response = self._register_bulk(devices)
+        self.assertEqual(response.status_code, 201)
+        result = json.loads(response.content.decode())['devices']
+        self.assertEqual(len(result), 3)
+        for i, device in enumerate(Device.objects.filter(organization=org).order_by('name')):
+            self.assertEqual(result[i]['key'], device.key)
+            self.assertEqual(result[i]['id'], device.pk.hex)
+            self.assertEqual(device.config.organization, org)
+            self.assertEqual(device.config.status, 'modified')
+            self.assertEqual(device.config.last_ip, '127.0.0.1')
+            expected = [t_default] if i == 0 else [t_default, t_mesh]
+            self.assertEqual(list(device.config.templates.all()), expected)
+
+    def test_register_bulk_errors(self):
+        org = self._create_org()
+        self._create_device(name='existing', mac_address='00:11:22:33:44:66', organization=org)
+        devices = [
+            {'name': 'device0', 'mac_address': '00:11:22:33:44:50',
+             'backend': 'netjsonconfig.OpenWrt'},
+            {'name': 'device1', 'mac_address': '00:11:22:33:44:66',
+             'backend': 'netjsonconfig.OpenWrt'},
+            {'name': 'device2', 'mac_address': '00:11:22:33:44:50',
+             'backend': 'wrong'},
+        ]
+        response = self._register_bulk(devices)
+        self.assertEqual(response.status_code, 400)
+        errors = json.loads(response.content.decode())
+        self.assertEqual(sorted(errors.keys()), ['1', '2'])
+        self.assertIn('mac_address', errors['1'])
+        self.assertIn('backend', errors['2'])
+        self.assertIn('mac_address', errors['2'])
+        self.assertEqual(Device.objects.count(), 1)
+
+    def test_register_bulk_400_403(self):
+        self._create_org()
+        response = self.client.post(REGISTER_BULK_URL, 'WRONG', content_type='application/json')
+        self.assertContains(response, 'malformed', status_code=400)
+        response = self._register_bulk([])
+        self.assertContains(response, 'devices', status_code=400)
+        response = self._register_bulk([{'name': 'device0'}], secret='WRONG')
+        self.assertContains(response, 'error: unrecognized secret', status_code=403)
+
     def test_checksum_404_disabled_org(self):
         org = self._create_org(is_active=False)
         c = self._create_config(organization=org)
@@ -129,12 +239,206 @@ class TestController(CreateConfigTemplateMixin, TestOrganizationMixin,
                                     {'key': c.device.key, 'status': 'running'})
         self.assertEqual(response.status_code, 404)
 
+    def test_report_status_no_op(self):
+        org = self._create_org()
+        c = self._create_config(organization=org, status='running')
+        url = reverse('controller:report_status', args=[c.device.pk])
+        params = {'key': c.device.key, 'status': 'running'}
+        self.client.post(url, params)
+        # unchanged status is not written
+        with self.assertNumQueries(1):
+            response = self.client.post(url, params)
+        self.assertContains(response, 'current-status: running')
+
+    def test_report_status_buffered(self):
+        self.addCleanup(setattr, app_settings, 'STATUS_FLUSH_INTERVAL', app_settings.STATUS_FLUSH_INTERVAL)
+        app_settings.STATUS_FLUSH_INTERVAL = 3600
+        status_buffer = get_status_buffer()
+        self.addCleanup(status_buffer._pending.clear)
+        org = self._create_org()
+        c = self._create_config(organization=org)
+        url = reverse('controller:report_status', args=[c.device.pk])
+        for i in range(2):
+            response = self.client.post(url, {'key': c.device.key, 'status': 'running'})
+            self.assertContains(response, 'current-status: running')
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'modified')
+        self.assertEqual(len(status_buffer), 1)
+        status_buffer.flush()
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'running')
+        # errors are written immediately and discard pending changes
+        c.set_status_modified()
+        self.client.post(url, {'key': c.device.key, 'status': 'running'})
+        response = self.client.post(url, {'key': c.device.key, 'status': 'error'})
+        self.assertContains(response, 'current-status: error')
+        self.assertEqual(len(status_buffer), 0)
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'error')
+        # changes to configurations modified in the meantime are discarded
+        self.client.post(url, {'key': c.device.key, 'status': 'running'})
+        c.set_status_modified()
+        status_buffer.flush()
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'modified')
+
+    def test_report_status_buffered_template_changed(self):
+        self.addCleanup(setattr, app_settings, 'STATUS_FLUSH_INTERVAL', app_settings.STATUS_FLUSH_INTERVAL)
+        app_settings.STATUS_FLUSH_INTERVAL = 3600
+        status_buffer = get_status_buffer()
+        self.addCleanup(status_buffer._pending.clear)
+        org = self._create_org()
+        template = self._create_template(organization=org)
+        c = self._create_config(organization=org)
+        c.templates.add(template)
+        url = reverse('controller:report_status', args=[c.device.pk])
+        self.client.post(url, {'key': c.device.key, 'status': 'running'})
+        self.assertEqual(len(status_buffer), 1)
+        # the template changes before the report is written
+        template.config['interfaces'][0]['name'] = 'eth1'
+        template.full_clean()
+        template.save()
+        status_buffer.flush()
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'modified')
+
     def test_checksum_200(self):
         org = self._create_org()
         c = self._create_config(organization=org)
         response = self.client.get(reverse('controller:checksum', args=[c.device.pk]), {'key': c.device.key})
         self.assertEqual(response.status_code, 200)
 
+    def test_checksum_stored(self):
+        org = self._create_org()
+        c = self._create_config(organization=org)
+        url = reverse('controller:checksum', args=[c.device.pk])
+        response = self.client.get(url, {'key': c.device.key})
+        c.refresh_from_db()
+        self.assertEqual(c.checksum_db, c.checksum)
+        self.assertContains(response, c.checksum)
+        # the device is authenticated through the cache,
+        # the stored checksum is retrieved together with the device
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'key': c.device.key})
+        self.assertContains(response, c.checksum)
+
+    def test_last_ip(self):
+        org = self._create_org()
+        c = self._create_config(organization=org)
+        c.get_cached_checksum()
+        url = reverse('controller:checksum', args=[c.device.pk])
+        writes = get_last_ip_writes()
+        self.client.get(url, {'key': c.device.key})
+        c.refresh_from_db()
+        self.assertEqual(c.last_ip, '127.0.0.1')
+        # the stored checksum is not affected
+        self.assertIsNotNone(c.checksum_db)
+        self.assertEqual(get_last_ip_writes()['written'], writes['written'] + 1)
+        # unchanged ip is not written
+        modified = c.modified
+        self.client.get(url, {'key': c.device.key})
+        self.assertEqual(get_last_ip_writes()['skipped'], writes['skipped'] + 1)
+        c.refresh_from_db()
+        self.assertEqual(c.modified, modified)
+        self.client.get(url, {'key': c.device.key}, REMOTE_ADDR='127.0.0.2')
+        c.refresh_from_db()
+        self.assertEqual(c.last_ip, '127.0.0.2')
+
+    def test_device_auth_cache(self):
+        org = self._create_org()
+        c = self._create_config(organization=org)
+        url = reverse('controller:checksum', args=[c.device.pk])
+        response = self.client.get(url, {'key': c.device.key})
+        self.assertEqual(response.status_code, 200)
+        # wrong keys are rejected without querying the database
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'key': 'wrong'})
+        self.assertContains(response, 'error: wrong key', status_code=403)
+        # the hex form of the UUID is accepted too
+        response = self.client.get(reverse('controller:checksum', args=[c.device.pk.hex]),
+                                   {'key': c.device.key})
+        self.assertEqual(response.status_code, 200)
+        # key change
+        old_key = c.device.key
+        c.device.key = 'new{0}'.format(old_key[3:])
+        c.device.full_clean()
+        c.device.save()
+        response = self.client.get(url, {'key': old_key})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(url, {'key': c.device.key})
+        self.assertEqual(response.status_code, 200)
+        # organization disabled
+        org.is_active = False
+        org.save()
+        response = self.client.get(url, {'key': c.device.key})
+        self.assertEqual(response.status_code, 404)
+        # device deleted
+        org.is_active = True
+        org.save()
+        c.device.delete()
+        response = self.client.get(url, {'key': c.device.key})
+        self.assertEqual(response.status_code, 404)
+
+    def test_checksum_etag(self):
+        org = self._create_org()
+        c = self._create_config(organization=org)
+        url = reverse('controller:checksum', args=[c.device.pk])
+        response = self.client.get(url, {'key': c.device.key})
+        etag = '"{0}"'.format(c.checksum)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(url, {'key': c.device.key}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['X-Openwisp-Controller'], 'true')
+        # wrong key is still forbidden
+        response = self.client.get(url, {'key': 'wrong'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 403)
+
+    def test_download_config_etag(self):
+        org = self._create_org()
+        c = self._create_config(organization=org)
+        url = reverse('controller:download_config', args=[c.device.pk])
+        response = self.client.get(url, {'key': c.device.key})
+        self.assertEqual(response.status_code, 200)
+        etag = '"{0}"'.format(c.checksum)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(url, {'key': c.device.key}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        # outdated ETag
+        response = self.client.get(url, {'key': c.device.key}, HTTP_IF_NONE_MATCH='"outdated"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_download_config_archive_store(self):
+        archive_root = tempfile.mkdtemp()
+        app_settings.CONFIG_ARCHIVE_ROOT = archive_root
+        try:
+            org = self._create_org()
+            c = self._create_config(organization=org)
+            url = reverse('controller:download_config', args=[c.device.pk])
+            response = self.client.get(url, {'key': c.device.key})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Openwisp-Controller'], 'true')
+            self.assertEqual(b''.join(response.streaming_content), c.generate().getvalue())
+            response.close()
+            c.refresh_from_db()
+            old_path = os.path.join(archive_root, c.pk.hex, '{0}.tar.gz'.format(c.checksum_db))
+            self.assertTrue(os.path.isfile(old_path))
+            # outdated archives are removed when a new one is generated
+            c.config = {'general': {'description': 'changed'}}
+            c.full_clean()
+            c.save()
+            response = self.client.get(url, {'key': c.device.key})
+            # the backend instance of ``c`` was cached before the change
+            expected = Config.objects.get(pk=c.pk).generate().getvalue()
+            self.assertEqual(b''.join(response.streaming_content), expected)
+            response.close()
+            self.assertFalse(os.path.isfile(old_path))
+            self.assertEqual(len(os.listdir(os.path.join(archive_root, c.pk.hex))), 1)
+        finally:
+            app_settings.CONFIG_ARCHIVE_ROOT = None
+            shutil.rmtree(archive_root)
+
 
 class TestRegistrationDisabled(TestOrganizationMixin, TestCase):
     @classmethod
@@ -159,3 +463,11 @@ class TestRegistrationDisabled(TestOrganizationMixin, TestCase):
         count = Device.objects.filter(mac_address=TEST_MACADDR,
                                       organization=org).count()
         self.assertEqual(count, 0)
+
+    def test_device_auth_cache_not_shared(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=locmem):
+            self.assertFalse(is_shared_cache())
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache'}}
+        with self.settings(CACHES=shared):
+            self.assertTrue(is_shared_cache())
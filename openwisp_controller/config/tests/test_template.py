@@ -1,11 +1,14 @@
 from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django_netjsonconfig.signals import config_modified
 
 from openwisp_users.tests.utils import TestOrganizationMixin
 
 from . import CreateConfigTemplateMixin, TestVpnX509Mixin
 from ...pki.models import Ca, Cert
+from .. import settings as app_settings
 from ..models import Config, Device, Template, Vpn
+from ..signals import configs_modified
 
 
 class TestTemplate(CreateConfigTemplateMixin, TestVpnX509Mixin,
@@ -94,3 +97,101 @@ class TestTemplate(CreateConfigTemplateMixin, TestVpnX509Mixin,
                               vpn=vpn,
                               config={})
         self._create_config(organization=org)
+
+    def _create_template_with_configs(self):
+        org = self._create_org()
+        template = self._create_template(organization=org)
+        for i in range(3):
+            device = self._create_device(organization=org,
+                                         name='d{0}'.format(i),
+                                         mac_address='00:11:22:33:44:0{0}'.format(i))
+            config = self._create_config(organization=org, device=device)
+            config.templates.add(template)
+            config.set_status_running()
+        return template
+
+    def _change_template(self, template):
+        template.config['interfaces'][0]['name'] = 'eth1'
+        template.full_clean()
+        template.save()
+
+    def test_bulk_config_modified(self):
+        template = self._create_template_with_configs()
+        received = []
+
+        def receiver(**kwargs):
+            received.append(kwargs['pk_list'])
+
+        configs_modified.connect(receiver, sender=Config)
+        app_settings.CONFIG_MODIFIED_CHUNK_SIZE = 2
+        try:
+            self._change_template(template)
+        finally:
+            configs_modified.disconnect(receiver, sender=Config)
+            app_settings.CONFIG_MODIFIED_CHUNK_SIZE = 1000
+        self.assertEqual(Config.objects.filter(status='modified').count(), 3)
+        self.assertEqual([len(pk_list) for pk_list in received], [2, 1])
+
+    def test_config_modified_per_device(self):
+        template = self._create_template_with_configs()
+        received = []
+
+        def receiver(**kwargs):
+            received.append(kwargs['config'].pk)
+
+        config_modified.connect(receiver, sender=Config)
+        app_settings.CONFIG_MODIFIED_PER_DEVICE = True
+        try:
+            self._change_template(template)
+        finally:
+            config_modified.disconnect(receiver, sender=Config)
+            app_settings.CONFIG_MODIFIED_PER_DEVICE = False
+        self.assertEqual(Config.objects.filter(status='modified').count(), 3)
+        self.assertEqual(len(received), 3)
+
+    def test_bulk_assign_template(self):
+        template = self._create_template_with_configs()
+        org = template.organization
+        device = self._create_device(organization=org, name='d3',
+                                     mac_address='00:11:22:33:44:03')
+        self._create_config(organization=org, device=device)
+        t2 = self._create_template(name='t2', organization=org,
+                                   config={'general': {'description': 'test'}})
+        assigned, invalid = Config.bulk_assign_template(t2, Config.objects.all())
+        self.assertEqual(len(assigned), 4)
+        self.assertEqual(invalid, [])
+        self.assertEqual(Config.objects.filter(status='modified').count(), 4)
+        # the new template is appended to the current ones
+        config = Config.objects.get(device__name='d0')
+        self.assertEqual([t.name for t in config.templates.all()], [template.name, 't2'])
+        self.assertEqual(config.get_backend_instance().config['general']['description'], 'test')
+        # configurations which already use the template are skipped
+        assigned, invalid = Config.bulk_assign_template(t2, Config.objects.all())
+        self.assertEqual(assigned, [])
+        self.assertEqual(invalid, [])
+
+    def test_bulk_assign_template_different_organization(self):
+        template = self._create_template_with_configs()
+        org2 = self._create_org(name='test org2', slug='test-org2')
+        t2 = self._create_template(name='t2', organization=org2)
+        assigned, invalid = Config.bulk_assign_template(t2, Config.objects.all())
+        self.assertEqual(assigned, [])
+        self.assertEqual(len(invalid), 3)
+        self.assertIn('do not match the organization', invalid[0][1])
+        self.assertEqual(Config.objects.filter(templates=t2).count(), 0)
+        self.assertEqual(Config.objects.filter(templates=template).count(), 3)
+
+    def test_bulk_assign_vpn_template(self):
+        template = self._create_template_with_configs()
+        org = template.organization
+        vpn = self._create_vpn(organization=org)
+        t2 = self._create_template(name='vpn-client', organization=org, type='vpn',
+                                   auto_cert=True, vpn=vpn, config={})
+        assigned, invalid = Config.bulk_assign_template(t2, Config.objects.all())
+        self.assertEqual(len(assigned), 3)
+        self.assertEqual(vpn.vpnclient_set.count(), 3)
+        # certificates are created automatically
+        self.assertEqual(vpn.vpnclient_set.filter(cert=None).count(), 0)
+        self.assertEqual(Cert.objects.filter(ca=vpn.ca).count(), 4)
+        # configurations are not rendered, checksums are generated when requested
+        self.assertEqual(Config.objects.exclude(checksum_db=None).count(), 0)
@@ -5,6 +5,7 @@ from openwisp_users.tests.utils import TestOrganizationMixin
 
 from . import CreateConfigTemplateMixin
 from ...tests.utils import TestAdminMixin
+from ..cache import get_default_template_pks
 from ..models import Template
 
 
@@ -66,3 +67,20 @@ class TestTemplate(CreateConfigTemplateMixin, TestAdminMixin,
         response = self.client.get(reverse('config:get_default_templates',
                                            args=['wrong']))
         self.assertEqual(response.status_code, 404)
+
+    def test_get_default_templates_cache(self):
+        org1, org2, t1, t2, t3, inactive_org, inactive_t = self._create_template_test_data()
+        self.assertEqual(sorted(get_default_template_pks(org1.pk)),
+                         sorted([str(t1.pk), str(t3.pk)]))
+        with self.assertNumQueries(0):
+            get_default_template_pks(org1.pk)
+        # shared templates invalidate the cache of every organization
+        t3.default = False
+        t3.full_clean()
+        t3.save()
+        self.assertEqual(get_default_template_pks(org1.pk), [str(t1.pk)])
+        self.assertEqual(get_default_template_pks(org2.pk), [str(t2.pk)])
+        self.assertIsNone(get_default_template_pks(inactive_org.pk))
+        inactive_org.is_active = True
+        inactive_org.save()
+        self.assertEqual(get_default_template_pks(inactive_org.pk), [str(inactive_t.pk)])
@@ -1,16 +1,23 @@
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils.six import StringIO
 
 from openwisp_users.tests.utils import TestOrganizationMixin
 
-from . import TestVpnX509Mixin
+from . import CreateConfigTemplateMixin, TestVpnX509Mixin
 from ...pki.models import Ca, Cert
-from ..models import Vpn
+from .. import settings as app_settings
+from ..models import Config, Device, DhParams, Template, Vpn
 
 
-class TestVpn(TestOrganizationMixin, TestVpnX509Mixin, TestCase):
+class TestVpn(TestOrganizationMixin, CreateConfigTemplateMixin,
+              TestVpnX509Mixin, TestCase):
     ca_model = Ca
     cert_model = Cert
+    config_model = Config
+    device_model = Device
+    template_model = Template
     vpn_model = Vpn
 
     def test_vpn_with_org(self):
@@ -55,3 +62,63 @@ class TestVpn(TestOrganizationMixin, TestVpnX509Mixin, TestCase):
             self.assertIn('related certificate match', e.message_dict['organization'][0])
         else:
             self.fail('ValidationError not raised')
+
+    def test_vpn_dh_pool(self):
+        DhParams.objects.create(length=app_settings.DH_LENGTH, dh=self._dh)
+        self.assertEqual(DhParams.get_pool_depth()[app_settings.DH_LENGTH], 1)
+        vpn = self._create_vpn(dh='')
+        self.assertEqual(vpn.dh, self._dh)
+        self.assertEqual(DhParams.get_pool_depth()[app_settings.DH_LENGTH], 0)
+        self.assertIsNone(DhParams.pop(app_settings.DH_LENGTH))
+
+    def test_filldhparams_command(self):
+        self.addCleanup(setattr, app_settings, 'DH_POOL', app_settings.DH_POOL)
+        app_settings.DH_POOL = {1024: 1}
+        DhParams.objects.create(length=1024, dh=self._dh)
+        # the pool is already full, nothing is generated
+        output = StringIO()
+        call_command('filldhparams', stdout=output)
+        self.assertIn('1024 bit: 1', output.getvalue())
+        self.assertEqual(DhParams.objects.count(), 1)
+        output = StringIO()
+        call_command('filldhparams', status=True, stdout=output)
+        self.assertIn('1024 bit: 1', output.getvalue())
+
+    def test_vpn_invalidates_checksum_db(self):
+        org = self._create_org()
+        vpn = self._create_vpn(organization=org)
+        t = self._create_template(organization=org, type='vpn', vpn=vpn, auto_cert=True)
+        c = self._create_config(organization=org)
+        c.templates.add(t)
+        client_cert = vpn.vpnclient_set.get().cert
+        for instance in [vpn, vpn.ca, vpn.cert, client_cert]:
+            c.get_cached_checksum()
+            instance.save()
+            c.refresh_from_db()
+            self.assertIsNone(c.checksum_db)
+        # settings affecting all the configurations
+        c.get_cached_checksum()
+        call_command('invalidatechecksums', stdout=StringIO())
+        c.refresh_from_db()
+        self.assertIsNone(c.checksum_db)
+
+    def test_reissue_client_certs(self):
+        org = self._create_org()
+        vpn = self._create_vpn(organization=org)
+        t = self._create_template(organization=org, type='vpn', vpn=vpn, auto_cert=True)
+        c = self._create_config(organization=org)
+        c.templates.add(t)
+        Config.objects.filter(pk=c.pk).update(status='running')
+        client = vpn.vpnclient_set.get()
+        old_cert = client.cert
+        self.assertEqual(vpn.reissue_client_certs(), 1)
+        old_cert.refresh_from_db()
+        self.assertTrue(old_cert.revoked)
+        client.refresh_from_db()
+        self.assertNotEqual(client.cert_id, old_cert.pk)
+        self.assertFalse(client.cert.revoked)
+        self.assertEqual(client.cert.common_name, old_cert.common_name)
+        self.assertEqual(client.cert.organization, org)
+        c.refresh_from_db()
+        self.assertEqual(c.status, 'modified')
+        self.assertIn(client.cert.certificate, c.get_context().values())
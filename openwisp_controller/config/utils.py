@@ -1,5 +1,10 @@
+import threading
+
 from django.db.models import Q
 
+_last_ip_lock = threading.Lock()
+_last_ip_writes = {'written': 0, 'skipped': 0}
+
 
 def get_default_templates_queryset(organization_id, queryset=None, model=None):
     """
@@ -15,3 +20,27 @@ def get_default_templates_queryset(organization_id, queryset=None, model=None):
     queryset = queryset.filter(Q(organization_id=organization_id) |
                                Q(organization_id=None))
     return queryset
+
+
+def update_last_ip(config, request):
+    """
+    like ``django_netjsonconfig.utils.update_last_ip``, but only
+    the ``last_ip`` field is written and only if the ip has changed;
+    writes and skipped writes are counted (see ``get_last_ip_writes``)
+    """
+    latest_ip = request.META.get('REMOTE_ADDR')
+    changed = config.last_ip != latest_ip
+    with _last_ip_lock:
+        _last_ip_writes['written' if changed else 'skipped'] += 1
+    if changed:
+        config.last_ip = latest_ip
+        config.save(update_fields=['last_ip'])
+
+
+def get_last_ip_writes():
+    """
+    returns a dictionary with the number of ``written`` and ``skipped``
+    writes of ``last_ip`` performed by the current process
+    """
+    with _last_ip_lock:
+        return _last_ip_writes.copy()
@@ -1,15 +1,12 @@
-from django.http import HttpResponse, JsonResponse
-from django_netjsonconfig.utils import get_object_or_404
+from django.http import Http404, HttpResponse, JsonResponse
 
-from openwisp_users.models import Organization
-
-from .models import Template
-from .utils import get_default_templates_queryset
+from .cache import get_default_template_pks
 
 
 def get_default_templates(request, organization_id):
     """
     returns default templates of specified organization
+    (cached, see ``get_default_template_pks``)
     """
     user = request.user
     authenticated = user.is_authenticated
@@ -17,7 +14,7 @@ def get_default_templates(request, organization_id):
         authenticated = authenticated()
     if not authenticated and not user.is_staff:
         return HttpResponse(status=403)
-    org = get_object_or_404(Organization, pk=organization_id, is_active=True)
-    templates = get_default_templates_queryset(org.pk, model=Template).only('id')
-    uuids = [str(t.pk) for t in templates]
+    uuids = get_default_template_pks(organization_id)
+    if uuids is None:
+        raise Http404()
     return JsonResponse({'default_templates': uuids})
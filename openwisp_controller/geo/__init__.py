@@ -0,0 +1 @@
+default_app_config = 'openwisp_controller.geo.apps.GeoConfig'
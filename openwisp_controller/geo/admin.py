@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.forms.widgets import TextInput
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from .models import Location, FloorPlan, DeviceLocation
 from ..admin import MultitenantAdminMixin
 from django_loci.base.admin import (AbstractFloorPlanForm, AbstractFloorPlanAdmin,
@@ -87,17 +87,14 @@ class LocationModelAdmin(admin.ModelAdmin):
         })
 
     def floorplans_json_view(self, request, pk):
-        instance = get_object_or_404(self.model, pk=pk)
-        choices = []
-        for floorplan in instance.floorplan_set.all():
-            choices.append({
-                'id': floorplan.pk,
-                'str': str(floorplan),
-                'floor': floorplan.floor,
-                'image': floorplan.image.url,
-                'image_width': floorplan.image.width,
-                'image_height': floorplan.image.height,
-            })
+        """
+        floorplans are cached (see ``Location.get_floorplans``),
+        images are not opened to read their dimensions
+        """
+        try:
+            choices = self.model.get_floorplans(pk)
+        except (self.model.DoesNotExist, ValidationError):
+            raise Http404()
         return JsonResponse({'choices': choices})
 
 
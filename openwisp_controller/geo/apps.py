@@ -1,17 +1,33 @@
-from django.conf import settings
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class GeoConfig(AppConfig):
-    # name = 'openwisp_controller.geo'
-    # label = 'geo'
+    name = 'openwisp_controller.geo'
+    label = 'geo'
     verbose_name = 'Geographic Information'
 
     def __setmodels__(self):
-        from .models import Location
+        from .models import FloorPlan, Location
         self.location_model = Location
+        self.floorplan_model = FloorPlan
 
     def ready(self):
         super(GeoConfig, self).ready()
-        if getattr(settings, 'TESTING', False):
-            self._add_params_to_test_config()
+        self.__setmodels__()
+        self.connect_signals()
+
+    def connect_signals(self):
+        """
+        * throttled broadcast of the position of locations
+        * invalidation of cached floorplans
+        """
+        post_save.connect(self.location_model.post_save,
+                          sender=self.location_model,
+                          dispatch_uid='ws_update_mobile_location')
+        post_save.connect(self.floorplan_model.post_save,
+                          sender=self.floorplan_model,
+                          dispatch_uid='floorplan_invalidate_cache')
+        post_delete.connect(self.floorplan_model.post_save,
+                            sender=self.floorplan_model,
+                            dispatch_uid='floorplan_delete_invalidate_cache')
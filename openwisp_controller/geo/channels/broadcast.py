@@ -0,0 +1,123 @@
+"""
+Throttled broadcast of the position of locations
+
+Each location is notified to its websocket group at most once every
+``OPENWISP_CONTROLLER_LOCATION_BROADCAST_INTERVAL`` milliseconds:
+changes received in the meantime are coalesced and only the latest
+position is sent when the interval expires. The message is serialized
+once and sent to the group, the channel layer takes care of the
+fan-out to the subscribers.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from channels import Group
+
+from .. import settings as app_settings
+
+logger = logging.getLogger(__name__)
+
+
+def get_group_name(pk):
+    return 'loci.mobile-location.{0}'.format(pk)
+
+
+def get_location_message(location):
+    """
+    returns the websocket message containing the
+    position of ``location`` as a GeoJSON point,
+    ``None`` if the location has no coordinates
+    """
+    if not location.geolocation:
+        return None
+    lat, lng = [float(value) for value in str(location.geolocation).split(',')]
+    geometry = {'type': 'Point', 'coordinates': [lng, lat]}
+    return {'text': json.dumps(geometry)}
+
+
+def send(pk, message):
+    Group(get_group_name(pk)).send(message, immediately=True)
+
+
+class LocationThrottle(object):
+    """
+    sends the messages of each location at most once every
+    ``interval`` seconds, keeping only the latest pending one;
+    the state is kept in memory, hence each process throttles
+    the changes it receives independently from the others
+    """
+    def __init__(self, interval, send=send):
+        self.interval = interval
+        self.send = send
+        # ordered by time of the last message
+        self._last_sent = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._last_sent)
+
+    def _set_last_sent(self, pk, now):
+        """
+        must be called with the lock acquired, evicts the
+        locations whose interval has already expired
+        """
+        self._last_sent.pop(pk, None)
+        self._last_sent[pk] = now
+        while self._last_sent:
+            key = next(iter(self._last_sent))
+            if self._last_sent[key] + self.interval > now:
+                break
+            del self._last_sent[key]
+
+    def add(self, pk, message):
+        now = time.time()
+        with self._lock:
+            wait = self._last_sent.get(pk, 0) + self.interval - now
+            if wait <= 0 and pk not in self._pending:
+                self._set_last_sent(pk, now)
+            else:
+                schedule = pk not in self._pending
+                self._pending[pk] = message
+                message = None
+        if message is not None:
+            self.send(pk, message)
+        elif schedule:
+            timer = threading.Timer(max(wait, 0), self.flush, [pk])
+            timer.daemon = True
+            timer.start()
+
+    def flush(self, pk):
+        with self._lock:
+            message = self._pending.pop(pk, None)
+            self._set_last_sent(pk, time.time())
+        if message is None:
+            return
+        try:
+            self.send(pk, message)
+        except Exception:
+            logger.exception('Broadcast of location {0} failed'.format(pk))
+
+
+_throttle = {}
+
+
+def broadcast_location(location):
+    """
+    notifies the position of ``location`` to its
+    subscribers (throttled, see ``LocationThrottle``)
+    """
+    message = get_location_message(location)
+    if message is None:
+        return
+    pk = str(location.pk)
+    interval = app_settings.LOCATION_BROADCAST_INTERVAL
+    if not interval:
+        send(pk, message)
+        return
+    if interval not in _throttle:
+        _throttle[interval] = LocationThrottle(interval / 1000.0)
+    _throttle[interval].add(pk, message)
@@ -1,17 +1,45 @@
-from django_loci.channels.base import BaseLocationBroadcast
+from channels import Group
+from django_loci.channels.base import BaseLocationBroadcast, _get_object_or_none
+
+from openwisp_users.models import OrganizationUser
 
 from ..models import Location
+from .broadcast import get_group_name
 
 
 class LocationBroadcast(BaseLocationBroadcast):
+    """
+    authorization is checked once when the websocket is opened
+    and its result is kept in the channel session of the connection
+    """
     model = Location
+    channel_session = True
+
+    def connect(self, message, pk):
+        location = _get_object_or_none(self.model, pk=pk)
+        if not location or not self.is_authorized(message.user, location):
+            message.reply_channel.send({'close': True})
+            return
+        message.channel_session['authorized_location'] = pk
+        message.reply_channel.send({'accept': True})
+        Group(get_group_name(pk)).add(message.reply_channel)
+
+    def receive(self, text=None, bytes=None, pk=None, **kwargs):
+        """
+        frames sent by clients are ignored, unauthorized
+        connections (if any) are closed without queries
+        """
+        if self.message.channel_session.get('authorized_location') != pk:
+            self.close()
 
     def is_authorized(self, user, location):
         result = super(LocationBroadcast, self).is_authorized(user, location)
         # non superusers must also be members of the org
-        if result and not user.is_superuser and (
-            (location.organization.pk,) not in
-            user.organizations_pk
-        ):
-            return False
+        if result and not user.is_superuser:
+            return OrganizationUser.objects.filter(user=user,
+                                                   organization_id=location.organization_id,
+                                                   organization__is_active=True).exists()
         return result
+
+    def disconnect(self, message, pk):
+        Group(get_group_name(pk)).discard(message.reply_channel)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.gis.db.models.fields
+from django.contrib.gis.geos import Point
+from django.db import migrations
+
+
+def populate_geometry(apps, schema_editor):
+    Location = apps.get_model('geo', 'Location')
+    for location in Location.objects.exclude(geolocation=None).exclude(geolocation='').iterator():
+        try:
+            lat, lng = [float(value) for value in str(location.geolocation).split(',')]
+        except ValueError:
+            continue
+        Location.objects.filter(pk=location.pk).update(geometry=Point(lng, lat, srid=4326))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0003_auto_20180328_1103'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geometry',
+            field=django.contrib.gis.db.models.fields.PointField(blank=True, editable=False, null=True, srid=4326),
+        ),
+        migrations.RunPython(populate_geometry, reverse_code=migrations.RunPython.noop),
+    ]
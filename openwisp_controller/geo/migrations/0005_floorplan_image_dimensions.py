@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django_loci.storage
+import openwisp_controller.geo.models
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models
+
+
+def populate_image_dimensions(apps, schema_editor):
+    FloorPlan = apps.get_model('geo', 'FloorPlan')
+    storage = FloorPlan._meta.get_field('image').storage
+    for pk, name in FloorPlan.objects.values_list('pk', 'image').iterator():
+        try:
+            with storage.open(name) as image:
+                width, height = get_image_dimensions(image)
+        except (IOError, OSError):
+            continue
+        FloorPlan.objects.filter(pk=pk).update(image_width=width, image_height=height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geo', '0004_location_geometry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='floorplan',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='floorplan',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='floorplan',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, storage=django_loci.storage.OverwriteStorage(), upload_to=openwisp_controller.geo.models.thumbnail_upload_to, verbose_name='thumbnail'),
+        ),
+        migrations.RunPython(populate_image_dimensions, reverse_code=migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='floorplan',
+            name='image',
+            field=models.ImageField(height_field='image_height', help_text='floor plan image', storage=django_loci.storage.OverwriteStorage(), upload_to=django_loci.storage.OverwriteStorage.upload_to, verbose_name='image', width_field='image_width'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from model_utils.fields import AutoCreatedField, AutoLastModifiedField
 from openwisp_users.mixins import OrgMixin, ValidateOrgMixin
 from django.contrib.gis.db import models
+from django.contrib.gis.geos import Point
 from django_loci.base.models import AbstractFloorPlan, AbstractObjectLocation
 from django.utils.translation import ugettext_lazy as _
 from django_google_maps.fields import AddressField, GeoLocationField
@@ -8,7 +9,17 @@ from openwisp_utils.base import TimeStampedEditableModel
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.core.exceptions import ValidationError
+import os
 import uuid
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django_loci import settings as loci_settings
+from PIL import Image
+
+from . import settings as app_settings
+from .channels.broadcast import broadcast_location
 
 
 class Location(models.Model):
@@ -26,10 +37,28 @@ class Location(models.Model):
     modified = AutoLastModifiedField(_('modified'), editable=False)
     address = AddressField(max_length=100, blank=True, null=True)
     geolocation = GeoLocationField(blank=True, null=True)
+    # kept in sync with geolocation, used for spatial queries
+    geometry = models.PointField(srid=4326, blank=True, null=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.geometry = self.get_geometry(self.geolocation)
+        super(Location, self).save(*args, **kwargs)
+
+    @staticmethod
+    def get_geometry(geolocation):
+        """
+        converts a ``geolocation`` value (``"lat,lng"``) to a point,
+        returns ``None`` if empty or not valid
+        """
+        try:
+            lat, lng = [float(value) for value in str(geolocation).split(',')]
+        except ValueError:
+            return None
+        return Point(lng, lat, srid=4326)
+
     def clean(self):
         self._validate_outdoor_floorplans()
 
@@ -50,9 +79,74 @@ class Location(models.Model):
     def short_type(self):
         return _(self.type.capitalize())
 
+    @classmethod
+    def post_save(cls, instance, created, **kwargs):
+        """
+        class method for ``post_save`` signal,
+        notifies the new position to websocket subscribers
+        """
+        if not created:
+            cls.invalidate_floorplans(instance.pk)
+            broadcast_location(instance)
+
+    @classmethod
+    def _get_floorplans_cache_key(cls, pk):
+        return 'openwisp_controller.floorplans.{0}'.format(pk)
+
+    @classmethod
+    def get_floorplans(cls, pk):
+        """
+        returns the list of floorplans of the location having primary
+        key ``pk`` (as dictionaries), which is stored in the django cache
+        until a floorplan or the location is changed;
+        raises ``DoesNotExist`` if the location does not exist
+        """
+        key = cls._get_floorplans_cache_key(pk)
+        floorplans = cache.get(key)
+        if floorplans is not None:
+            return floorplans
+        location = cls.objects.get(pk=pk)
+        floorplans = []
+        for floorplan in location.floorplan_set.all():
+            floorplan.location = location
+            thumbnail = floorplan.thumbnail or floorplan.image
+            floorplans.append({
+                'id': floorplan.pk,
+                'str': str(floorplan),
+                'floor': floorplan.floor,
+                'image': floorplan.image.url,
+                'image_width': floorplan.image_width,
+                'image_height': floorplan.image_height,
+                'thumbnail': thumbnail.url,
+            })
+        cache.set(key, floorplans, app_settings.FLOORPLANS_CACHE_TIMEOUT)
+        return floorplans
+
+    @classmethod
+    def invalidate_floorplans(cls, pk):
+        cache.delete(cls._get_floorplans_cache_key(pk))
+
+
+def thumbnail_upload_to(instance, filename):
+    return 'floorplans/thumbnails/{0}.{1}'.format(instance.id, filename.split('.')[-1])
+
 
 class FloorPlan(OrgMixin, AbstractFloorPlan):
     location = models.ForeignKey(Location, models.CASCADE)
+    # dimensions are stored when the image is uploaded
+    image = models.ImageField(_('image'),
+                              upload_to=loci_settings.FLOORPLAN_STORAGE.upload_to,
+                              storage=loci_settings.FLOORPLAN_STORAGE(),
+                              width_field='image_width',
+                              height_field='image_height',
+                              help_text=_('floor plan image'))
+    image_width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    image_height = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    thumbnail = models.ImageField(_('thumbnail'),
+                                  upload_to=thumbnail_upload_to,
+                                  storage=loci_settings.FLOORPLAN_STORAGE(),
+                                  blank=True,
+                                  editable=False)
 
     class Meta(AbstractFloorPlan.Meta):
         abstract = False
@@ -63,6 +157,42 @@ class FloorPlan(OrgMixin, AbstractFloorPlan):
         self._validate_org_relation('location')
         super(FloorPlan, self).clean()
 
+    def save(self, *args, **kwargs):
+        """
+        generates the thumbnail when a new image is uploaded
+        """
+        if self.image and not self.image._committed:
+            self._generate_thumbnail()
+        super(FloorPlan, self).save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        if self.thumbnail:
+            self.thumbnail.delete(save=False)
+        super(FloorPlan, self).delete(*args, **kwargs)
+
+    def _generate_thumbnail(self):
+        """
+        resizes the uploaded image (before it is stored)
+        to ``OPENWISP_CONTROLLER_FLOORPLAN_THUMBNAIL_SIZE``
+        """
+        self.image.seek(0)
+        image = Image.open(self.image)
+        image_format = image.format or 'PNG'
+        image.thumbnail(app_settings.FLOORPLAN_THUMBNAIL_SIZE)
+        output = BytesIO()
+        image.save(output, format=image_format)
+        self.image.seek(0)
+        self.thumbnail.save(os.path.basename(self.image.name),
+                            ContentFile(output.getvalue()),
+                            save=False)
+
+    @classmethod
+    def post_save(cls, instance, **kwargs):
+        """
+        class method for ``post_save`` and ``post_delete`` signals
+        """
+        Location.invalidate_floorplans(instance.location_id)
+
 
 class ObjectLocation(TimeStampedEditableModel):
     LOCATION_TYPES = (
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+LOCATION_BROADCAST_INTERVAL = getattr(settings, 'OPENWISP_CONTROLLER_LOCATION_BROADCAST_INTERVAL', 1000)
+LOCATION_CLUSTER_MAX_ZOOM = getattr(settings, 'OPENWISP_CONTROLLER_LOCATION_CLUSTER_MAX_ZOOM', 12)
+FLOORPLAN_THUMBNAIL_SIZE = getattr(settings, 'OPENWISP_CONTROLLER_FLOORPLAN_THUMBNAIL_SIZE', (1024, 1024))
+FLOORPLANS_CACHE_TIMEOUT = getattr(settings, 'OPENWISP_CONTROLLER_FLOORPLANS_CACHE_TIMEOUT', 60 * 60 * 24)
@@ -5,7 +5,21 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import json
+import time
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.urls import reverse
+from PIL import Image
+
+from openwisp_users.tests.utils import TestOrganizationMixin
+
+from ..config.models import Config, Device
+from ..config.tests import CreateConfigTemplateMixin
+from .channels.broadcast import LocationThrottle, get_location_message
+from .models import DeviceLocation, FloorPlan, Location
 
 
 class SimpleTest(TestCase):
@@ -15,3 +29,187 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class TestLocationThrottle(TestCase):
+    def _get_throttle(self, interval):
+        sent = []
+        throttle = LocationThrottle(interval, send=lambda pk, message: sent.append((pk, message)))
+        return throttle, sent
+
+    def test_send_immediately(self):
+        throttle, sent = self._get_throttle(0.05)
+        throttle.add('1', {'text': 'a'})
+        throttle.add('2', {'text': 'b'})
+        self.assertEqual(sent, [('1', {'text': 'a'}), ('2', {'text': 'b'})])
+
+    def test_coalesce(self):
+        throttle, sent = self._get_throttle(0.05)
+        throttle.add('1', {'text': 'a'})
+        throttle.add('1', {'text': 'b'})
+        throttle.add('1', {'text': 'c'})
+        self.assertEqual(sent, [('1', {'text': 'a'})])
+        time.sleep(0.2)
+        # only the latest position is sent when the interval expires
+        self.assertEqual(sent, [('1', {'text': 'a'}), ('1', {'text': 'c'})])
+
+    def test_evict_expired(self):
+        throttle, sent = self._get_throttle(0.05)
+        throttle.add('1', {'text': 'a'})
+        throttle.add('2', {'text': 'b'})
+        self.assertEqual(len(throttle), 2)
+        time.sleep(0.1)
+        throttle.add('3', {'text': 'c'})
+        self.assertEqual(len(throttle), 1)
+        self.assertEqual(len(sent), 3)
+
+    def test_location_message(self):
+        location = Location(geolocation='41.9,12.5')
+        message = get_location_message(location)
+        self.assertEqual(json.loads(message['text']),
+                         {'type': 'Point', 'coordinates': [12.5, 41.9]})
+        self.assertIsNone(get_location_message(Location()))
+
+
+class TestUpdateLocationView(CreateConfigTemplateMixin, TestOrganizationMixin, TestCase):
+    config_model = Config
+    device_model = Device
+
+    def _create_device_location(self, is_mobile=True):
+        org = self._create_org()
+        config = self._create_config(organization=org)
+        location = Location.objects.create(organization=org,
+                                           name='vehicle',
+                                           type='outdoor',
+                                           is_mobile=is_mobile,
+                                           geolocation='41.9,12.5')
+        DeviceLocation.objects.create(content_object=config.device, location=location)
+        return config.device, location
+
+    def _post(self, device, data):
+        url = reverse('geo:update_location', args=[device.pk])
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_update_location(self):
+        device, location = self._create_device_location()
+        fixes = [{'lat': 41.91, 'lng': 12.51}, {'lat': 41.92, 'lng': 12.52}]
+        response = self._post(device, {'key': device.key, 'fixes': fixes})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'fixes: 2')
+        location.refresh_from_db()
+        self.assertEqual(str(location.geolocation), '41.92,12.52')
+        self.assertEqual(location.geometry.coords, (12.52, 41.92))
+
+    def test_update_location_bad_requests(self):
+        device, location = self._create_device_location()
+        fixes = [{'lat': 41.91, 'lng': 12.51}]
+        response = self._post(device, {'key': 'wrong', 'fixes': fixes})
+        self.assertEqual(response.status_code, 403)
+        response = self._post(device, {'key': device.key, 'fixes': []})
+        self.assertEqual(response.status_code, 400)
+        response = self._post(device, {'key': device.key, 'fixes': [{'lat': 100, 'lng': 0}]})
+        self.assertEqual(response.status_code, 400)
+        location.is_mobile = False
+        location.save()
+        response = self._post(device, {'key': device.key, 'fixes': fixes})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestDeviceLocationsView(CreateConfigTemplateMixin, TestOrganizationMixin, TestCase):
+    config_model = Config
+    device_model = Device
+
+    def _create_device_location(self, name, mac_address, geolocation):
+        org = self._create_org(name='org-{0}'.format(name))
+        device = self._create_device(name=name, mac_address=mac_address, organization=org)
+        location = Location.objects.create(organization=org,
+                                           name=name,
+                                           type='outdoor',
+                                           is_mobile=False,
+                                           geolocation=geolocation)
+        DeviceLocation.objects.create(content_object=device, location=location)
+        return device
+
+    def _get(self, **params):
+        return self.client.get(reverse('geo:device_locations'), params)
+
+    def test_geometry(self):
+        org = self._create_org()
+        location = Location.objects.create(organization=org, name='test',
+                                           type='outdoor', is_mobile=False,
+                                           geolocation='41.9,12.5')
+        self.assertEqual(location.geometry.coords, (12.5, 41.9))
+        location.geolocation = ''
+        location.save()
+        self.assertIsNone(location.geometry)
+
+    def test_device_locations(self):
+        self.client.force_login(self._create_admin())
+        d1 = self._create_device_location('rome1', '00:11:22:33:44:01', '41.90,12.49')
+        self._create_device_location('rome2', '00:11:22:33:44:02', '41.91,12.50')
+        self._create_device_location('paris', '00:11:22:33:44:03', '48.85,2.35')
+        response = self._get(bbox='12,41,13,42', zoom=15)
+        self.assertEqual(response.status_code, 200)
+        features = response.json()['features']
+        self.assertEqual(len(features), 2)
+        self.assertIn(str(d1.pk), [f['properties']['device'] for f in features])
+        # devices of the same area are clustered at low zoom levels
+        response = self._get(bbox='-10,30,30,60', zoom=3)
+        features = response.json()['features']
+        self.assertEqual(sorted(f['properties']['count'] for f in features), [1, 2])
+
+    def test_device_locations_bad_requests(self):
+        response = self._get(bbox='12,41,13,42')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(self._create_admin())
+        response = self._get(bbox='12,41,13')
+        self.assertEqual(response.status_code, 400)
+        response = self._get()
+        self.assertEqual(response.status_code, 400)
+
+
+class TestFloorPlan(TestOrganizationMixin, TestCase):
+    def _get_image(self, size=(2048, 1024)):
+        output = BytesIO()
+        Image.new('RGB', size).save(output, format='PNG')
+        return SimpleUploadedFile('floorplan.png', output.getvalue(), content_type='image/png')
+
+    def _create_floorplan(self):
+        org = self._create_org()
+        location = Location.objects.create(organization=org, name='building',
+                                           type='indoor', is_mobile=False,
+                                           geolocation='41.9,12.5')
+        floorplan = FloorPlan(organization=org, location=location,
+                              floor=1, image=self._get_image())
+        floorplan.full_clean()
+        floorplan.save()
+        self.addCleanup(floorplan.delete)
+        return floorplan
+
+    def test_image_dimensions_and_thumbnail(self):
+        floorplan = self._create_floorplan()
+        self.assertEqual((floorplan.image_width, floorplan.image_height), (2048, 1024))
+        floorplan = FloorPlan.objects.get(pk=floorplan.pk)
+        self.assertEqual((floorplan.image_width, floorplan.image_height), (2048, 1024))
+        self.assertEqual(Image.open(floorplan.thumbnail).size, (1024, 512))
+
+    def test_floorplans_cache(self):
+        floorplan = self._create_floorplan()
+        location_pk = floorplan.location_id
+        floorplans = Location.get_floorplans(location_pk)
+        self.assertEqual(len(floorplans), 1)
+        self.assertEqual(floorplans[0]['image_width'], 2048)
+        self.assertEqual(floorplans[0]['thumbnail'], floorplan.thumbnail.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(Location.get_floorplans(location_pk), floorplans)
+        floorplan.floor = 2
+        floorplan.save()
+        self.assertEqual(Location.get_floorplans(location_pk)[0]['floor'], 2)
+
+    def test_floorplans_json_view(self):
+        floorplan = self._create_floorplan()
+        self.client.force_login(self._create_admin())
+        url = reverse('admin:django_loci_location_floorplans_json', args=[floorplan.location_id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['choices'][0]['image_height'], 1024)
@@ -0,0 +1,14 @@
+from django.conf.urls import url
+
+from . import views
+
+app_name = 'openwisp_controller'
+
+urlpatterns = [
+    url(r'^controller/location/(?P<pk>[^/]+)/$',
+        views.update_location,
+        name='update_location'),
+    url(r'^geo/api/device-locations/$',
+        views.device_locations,
+        name='device_locations'),
+]
@@ -1,7 +1,150 @@
-from django.views.generic import FormView
+import json
+
+from django.contrib.gis.db.models.functions import SnapToGrid
+from django.contrib.gis.geos import Polygon
+from django.db.models import Count
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views.generic import FormView, View
+from django_netjsonconfig.controller.generics import CsrfExtemptMixin
+from django_netjsonconfig.utils import ControllerResponse, invalid_response
+
+from ..config.controller.views import ActiveOrgMixin
+from . import settings as app_settings
+from .channels.broadcast import broadcast_location
 from .forms import LocationForm
+from .models import DeviceLocation, Location
 
 
 class LocationFormView(FormView):
     form_class = LocationForm
     template_name = "geo/index.html"
+
+
+class UpdateLocationView(ActiveOrgMixin, CsrfExtemptMixin, View):
+    """
+    receives the position of mobile devices, authenticated with the
+    device key like the controller views, expects a JSON body like::
+
+        {
+            "key": "<device key>",
+            "fixes": [
+                {"lat": 41.90, "lng": 12.49},
+                {"lat": 41.91, "lng": 12.50}
+            ]
+        }
+
+    fixes are expected in chronological order and coalesced: only the
+    last one is written (a single ``UPDATE`` of the ``geolocation`` and
+    ``geometry`` columns, without loading the location) and broadcast
+    """
+    def get_data(self, request):
+        """
+        returns the JSON body, ``None`` if malformed
+        """
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        fixes = data.get('fixes')
+        if not isinstance(fixes, list) or not fixes:
+            return None
+        return data
+
+    def clean_fix(self, fix):
+        """
+        returns a ``(lat, lng)`` tuple, ``None`` if ``fix`` is invalid
+        """
+        try:
+            lat, lng = float(fix['lat']), float(fix['lng'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            return None
+        return lat, lng
+
+    def post(self, request, *args, **kwargs):
+        data = self.get_data(request)
+        if data is None:
+            return invalid_response(request, 'error: malformed JSON body', status=400)
+        forbidden = self.forbidden_key(request, data.get('key'), kwargs['pk'])
+        if forbidden:
+            return forbidden
+        fixes = [self.clean_fix(fix) for fix in data['fixes']]
+        if None in fixes:
+            return invalid_response(request, 'error: invalid fix', status=400)
+        location_pk = DeviceLocation.objects.filter(content_object_id=kwargs['pk'],
+                                                    location__is_mobile=True) \
+                                            .values_list('location_id', flat=True) \
+                                            .first()
+        if not location_pk:
+            return invalid_response(request, 'error: device has no mobile location', status=404)
+        location = Location(pk=location_pk, geolocation='{0},{1}'.format(*fixes[-1]))
+        Location.objects.filter(pk=location_pk).update(
+            geolocation=location.geolocation,
+            geometry=Location.get_geometry(location.geolocation),
+            modified=timezone.now()
+        )
+        broadcast_location(location)
+        return ControllerResponse('location-result: success\n'
+                                  'fixes: {0}\n'.format(len(fixes)),
+                                  content_type='text/plain')
+
+
+# number of cells of each side of a map tile used for clustering
+CLUSTER_GRID_SIZE = 4
+
+
+def _get_feature(geometry, **properties):
+    return {'type': 'Feature',
+            'geometry': json.loads(geometry.geojson),
+            'properties': properties}
+
+
+def device_locations(request):
+    """
+    returns the devices inside the viewport specified in the ``bbox``
+    parameter (``min_lng,min_lat,max_lng,max_lat``) as GeoJSON; when
+    ``zoom`` is lower than ``OPENWISP_CONTROLLER_LOCATION_CLUSTER_MAX_ZOOM``
+    devices are clustered by the database on a grid and each
+    feature contains the number of devices of its cell
+    """
+    user = request.user
+    authenticated = user.is_authenticated
+    if callable(authenticated):
+        authenticated = authenticated()
+    if not authenticated or not user.is_staff:
+        return HttpResponse(status=403)
+    try:
+        bbox = [float(value) for value in request.GET['bbox'].split(',')]
+        zoom = int(request.GET.get('zoom', app_settings.LOCATION_CLUSTER_MAX_ZOOM))
+        if len(bbox) != 4 or zoom < 0:
+            raise ValueError()
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'bbox and zoom parameters are not valid'}, status=400)
+    queryset = DeviceLocation.objects.filter(location__geometry__within=Polygon.from_bbox(bbox))
+    if not user.is_superuser:
+        queryset = queryset.filter(location__organization__in=user.organizations_pk)
+    if zoom < app_settings.LOCATION_CLUSTER_MAX_ZOOM:
+        size = 360.0 / 2 ** zoom / CLUSTER_GRID_SIZE
+        cells = queryset.annotate(cell=SnapToGrid('location__geometry', size)) \
+                        .values('cell') \
+                        .annotate(count=Count('pk')) \
+                        .order_by()
+        features = [_get_feature(cell['cell'], count=cell['count']) for cell in cells]
+    else:
+        values = queryset.values_list('content_object_id',
+                                      'content_object__name',
+                                      'location_id',
+                                      'location__geometry')
+        features = [_get_feature(geometry,
+                                 device=str(device_pk),
+                                 name=name,
+                                 location=str(location_pk))
+                    for device_pk, name, location_pk, geometry in values]
+    return JsonResponse({'type': 'FeatureCollection', 'features': features})
+
+
+update_location = UpdateLocationView.as_view()
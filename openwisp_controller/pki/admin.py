@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils.translation import ungettext
 from django_x509.base.admin import AbstractCaAdmin, AbstractCertAdmin
 from reversion.admin import VersionAdmin
 
@@ -20,6 +21,18 @@ CaAdmin.list_display.insert(1, 'organization')
 class CertAdmin(MultitenantAdminMixin, VersionAdmin, AbstractCertAdmin):
     multitenant_shared_relations = ('ca',)
 
+    def revoke_action(self, request, queryset):
+        """
+        revokes the selected certificates with a single query
+        """
+        count = Cert.bulk_revoke(queryset)
+        message = ungettext('%(count)d certificate was revoked.',
+                            '%(count)d certificates were revoked.',
+                            count) % {'count': count}
+        self.message_user(request, message)
+
+    revoke_action.short_description = AbstractCertAdmin.revoke_action.short_description
+
 
 CertAdmin.fields.insert(2, 'organization')
 CertAdmin.list_filter.insert(0, ('organization', MultitenantOrgFilter))
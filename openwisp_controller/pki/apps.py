@@ -1,7 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import ugettext_lazy as _
 
 
 class PkiConfig(AppConfig):
     name = 'openwisp_controller.pki'
     verbose_name = _('Public Key Infrastructure')
+
+    def ready(self):
+        self.connect_signals()
+
+    def connect_signals(self):
+        """
+        * invalidation of cached CRLs
+        """
+        from .models import Ca, Cert
+        for model in [Ca, Cert]:
+            post_save.connect(model.post_save,
+                              sender=model,
+                              dispatch_uid='{0}_invalidate_crl'.format(model.__name__.lower()))
+            post_delete.connect(model.post_save,
+                                sender=model,
+                                dispatch_uid='{0}_delete_invalidate_crl'.format(model.__name__.lower()))
@@ -0,0 +1,74 @@
+import time
+from multiprocessing import Pool, cpu_count
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.encoding import force_text
+from OpenSSL import crypto
+
+from ... import settings as app_settings
+from ...models import PrivateKey
+
+
+def generate_key(length):
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, length)
+    return length, force_text(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+
+
+class Command(BaseCommand):
+    help = ('Fills the pool of pre-generated private keys '
+            'up to the depth configured in OPENWISP_CONTROLLER_KEY_POOL')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', action='store', dest='processes',
+                            default=cpu_count(), type=int,
+                            help='Number of worker processes generating keys '
+                                 '(defaults to the number of CPUs).')
+        parser.add_argument('--interval', action='store', dest='interval',
+                            default=0, type=int,
+                            help='Checks the pool every INTERVAL seconds '
+                                 'instead of exiting after filling it.')
+        parser.add_argument('--status', action='store_true', dest='status',
+                            help='Prints the depth of the pool and exits.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['status']:
+            self.print_depth()
+            return
+        self.processes = options['processes']
+        self.pool = None
+        try:
+            while True:
+                self.fill()
+                if not options['interval']:
+                    break
+                close_old_connections()
+                time.sleep(options['interval'])
+        finally:
+            if self.pool:
+                self.pool.terminate()
+
+    def fill(self):
+        depth = PrivateKey.get_pool_depth()
+        lengths = []
+        for length, size in app_settings.KEY_POOL.items():
+            lengths += [length] * max(size - depth.get(length, 0), 0)
+        if lengths:
+            self.generate(lengths)
+        if self.verbosity > 0:
+            self.print_depth()
+
+    def generate(self, lengths):
+        # worker processes are started only when needed
+        if not self.pool:
+            self.pool = Pool(self.processes)
+        for length, private_key in self.pool.imap_unordered(generate_key, lengths):
+            PrivateKey.objects.create(length=length, private_key=private_key)
+            if self.verbosity > 1:
+                self.stdout.write('Generated {0} bit key'.format(length))
+
+    def print_depth(self):
+        for length, count in sorted(PrivateKey.get_pool_depth().items()):
+            self.stdout.write('{0} bit: {1}'.format(length, count))
@@ -0,0 +1,30 @@
+# Generated by Django 2.0.2 on 2018-04-13 11:05
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pki', '0005_organizational_unit_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrivateKey',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified')),
+                ('length', models.PositiveIntegerField(db_index=True, verbose_name='length')),
+                ('private_key', models.TextField(verbose_name='private key')),
+            ],
+            options={
+                'verbose_name': 'private key',
+                'verbose_name_plural': 'private keys',
+            },
+        ),
+    ]
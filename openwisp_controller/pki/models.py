@@ -1,19 +1,129 @@
-from django.db import models
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
+from django_x509.base import models as x509_models
 from django_x509.base.models import AbstractCa, AbstractCert
+from OpenSSL import crypto
 
 from openwisp_users.mixins import ShareableOrgMixin
+from openwisp_utils.base import TimeStampedEditableModel
+
+from . import settings as app_settings
+
 
+class PooledKey(crypto.PKey):
+    """
+    private key taken from the pool of pre-generated keys,
+    ``generate_key`` does nothing because the key already exists
+    """
+    def generate_key(self, type, bits):
+        pass
 
-class Ca(ShareableOrgMixin, AbstractCa):
+    @classmethod
+    def load(cls, private_key):
+        key = crypto.load_privatekey(crypto.FILETYPE_PEM, private_key)
+        key.__class__ = cls
+        return key
+
+
+class KeyPoolCrypto(object):
+    """
+    stands in for ``OpenSSL.crypto`` in ``django_x509.base.models``
+    only while ``KeyPoolMixin`` generates a certificate (see ``use_key``):
+    ``PKey()`` returns the pooled key once in the thread which set it,
+    everything else (and other threads) is handled by ``OpenSSL.crypto``
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._users = 0
+
+    def __getattr__(self, name):
+        return getattr(crypto, name)
+
+    def PKey(self):
+        key = getattr(self._local, 'key', None)
+        self._local.key = None
+        return key or crypto.PKey()
+
+    @contextmanager
+    def use_key(self, key):
+        with self._lock:
+            if not self._users:
+                x509_models.crypto = self
+            self._users += 1
+        self._local.key = key
+        try:
+            yield
+        finally:
+            self._local.key = None
+            with self._lock:
+                self._users -= 1
+                if not self._users:
+                    x509_models.crypto = crypto
+
+
+key_pool_crypto = KeyPoolCrypto()
+
+
+class KeyPoolMixin(object):
+    """
+    takes the private key of new certificates from the
+    pool of pre-generated keys (see ``PrivateKey``),
+    the certificate is generated by ``django_x509``
+    """
+    def _generate(self):
+        private_key = PrivateKey.pop(int(self.key_length))
+        if not private_key:
+            return super(KeyPoolMixin, self)._generate()
+        with key_pool_crypto.use_key(PooledKey.load(private_key)):
+            super(KeyPoolMixin, self)._generate()
+
+
+class Ca(ShareableOrgMixin, KeyPoolMixin, AbstractCa):
     """
     openwisp-controller CA model
     """
     class Meta(AbstractCa.Meta):
         abstract = False
 
+    @classmethod
+    def _get_crl_cache_key(cls, pk):
+        return 'openwisp_controller.crl.{0}'.format(pk)
+
+    @classmethod
+    def get_cached_crl(cls, pk):
+        """
+        returns a tuple containing the signed CRL of the CA having primary
+        key ``pk`` and its generation time, the CRL is stored in the django
+        cache until the CA or its certificates change (see ``invalidate_crl``)
+        or ``OPENWISP_CONTROLLER_CRL_CACHE_TIMEOUT`` expires;
+        raises ``DoesNotExist`` if the CA does not exist
+        """
+        key = cls._get_crl_cache_key(pk)
+        value = cache.get(key)
+        if value is None:
+            value = (cls.objects.get(pk=pk).crl, timezone.now())
+            cache.set(key, value, app_settings.CRL_CACHE_TIMEOUT)
+        return value
 
-class Cert(ShareableOrgMixin, AbstractCert):
+    @classmethod
+    def invalidate_crl(cls, pk):
+        cache.delete(cls._get_crl_cache_key(pk))
+
+    @classmethod
+    def post_save(cls, instance, **kwargs):
+        """
+        class method for ``post_save`` and ``post_delete`` signals
+        """
+        cls.invalidate_crl(instance.pk)
+
+
+class Cert(ShareableOrgMixin, KeyPoolMixin, AbstractCert):
     """
     openwisp-controller cert model
     """
@@ -24,3 +134,71 @@ class Cert(ShareableOrgMixin, AbstractCert):
 
     def clean(self):
         self._validate_org_relation('ca')
+
+    @classmethod
+    def post_save(cls, instance, **kwargs):
+        """
+        class method for ``post_save`` and ``post_delete`` signals,
+        revocations (and any other change) invalidate the cached CRL
+        """
+        Ca.invalidate_crl(instance.ca_id)
+
+    @classmethod
+    def bulk_revoke(cls, queryset):
+        """
+        revokes the certificates of ``queryset`` with a single ``UPDATE``
+        (instead of saving each one as ``revoke()`` does), the cached
+        CRL of each CA involved is invalidated only once;
+        returns the number of revoked certificates
+        """
+        queryset = queryset.filter(revoked=False)
+        with transaction.atomic():
+            ca_pks = set(queryset.values_list('ca_id', flat=True))
+            count = queryset.update(revoked=True, revoked_at=timezone.now())
+        for ca_pk in ca_pks:
+            Ca.invalidate_crl(ca_pk)
+        return count
+
+
+class PrivateKey(TimeStampedEditableModel):
+    """
+    pool of pre-generated RSA private keys used by new
+    ``Ca`` and ``Cert`` objects, filled by the
+    ``fillkeypool`` management command
+    """
+    length = models.PositiveIntegerField(_('length'), db_index=True)
+    private_key = models.TextField(_('private key'))
+
+    class Meta:
+        verbose_name = _('private key')
+        verbose_name_plural = _('private keys')
+
+    @classmethod
+    def pop(cls, length):
+        """
+        removes a key of ``length`` bits from the
+        pool and returns it, ``None`` if the pool is empty
+        """
+        while True:
+            key = cls.objects.filter(length=length) \
+                             .order_by('created') \
+                             .values_list('pk', 'private_key') \
+                             .first()
+            if key is None:
+                return None
+            # keys taken concurrently by another process are skipped
+            if cls.objects.filter(pk=key[0]).delete()[0]:
+                return key[1]
+
+    @classmethod
+    def get_pool_depth(cls):
+        """
+        returns a dictionary which maps each length
+        to the number of keys in the pool
+        """
+        depth = {length: 0 for length in app_settings.KEY_POOL}
+        queryset = cls.objects.values_list('length') \
+                              .annotate(count=models.Count('pk')) \
+                              .order_by()
+        depth.update(dict(queryset))
+        return depth
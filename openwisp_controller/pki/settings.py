@@ -0,0 +1,5 @@
+from django.conf import settings
+from django_x509 import settings as x509_settings
+
+KEY_POOL = getattr(settings, 'OPENWISP_CONTROLLER_KEY_POOL', {int(x509_settings.DEFAULT_KEY_LENGTH): 10})
+CRL_CACHE_TIMEOUT = getattr(settings, 'OPENWISP_CONTROLLER_CRL_CACHE_TIMEOUT', 60 * 60 * 12)
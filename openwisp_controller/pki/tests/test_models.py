@@ -1,12 +1,18 @@
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
+from django.utils.encoding import force_text
+from django.utils.six import StringIO
+from django_x509.base import models as x509_models
 from OpenSSL import crypto
 
 from openwisp_users.tests.utils import TestOrganizationMixin
 
 from . import TestPkiMixin
-from ..models import Ca, Cert
+from .. import settings as app_settings
+from ..management.commands.fillkeypool import generate_key
+from ..models import Ca, Cert, PrivateKey
 
 
 class TestModels(TestCase, TestPkiMixin, TestOrganizationMixin):
@@ -52,3 +58,81 @@ class TestModels(TestCase, TestPkiMixin, TestOrganizationMixin):
         crl = crypto.load_crl(crypto.FILETYPE_PEM, response.content)
         revoked_list = crl.get_revoked()
         self.assertIsNone(revoked_list)
+
+    def test_crl_view_cached(self):
+        ca = self._create_ca()
+        url = reverse('x509:crl', args=[ca.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response2 = self.client.get(url)
+        self.assertEqual(response2.content, response.content)
+        with self.assertNumQueries(0):
+            response3 = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response3.status_code, 304)
+        self.assertEqual(response3.content, b'')
+
+    def test_crl_view_invalidation(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca=ca)
+        url = reverse('x509:crl', args=[ca.pk])
+        response = self.client.get(url)
+        cert.revoke()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, response.content)
+        self.assertEqual(len(crl.get_revoked()), 1)
+
+    def test_bulk_revoke(self):
+        ca = self._create_ca()
+        cert1 = self._create_cert(ca=ca, name='cert1')
+        cert2 = self._create_cert(ca=ca, name='cert2')
+        cert3 = self._create_cert(ca=ca, name='cert3')
+        cert3.revoke()
+        url = reverse('x509:crl', args=[ca.pk])
+        self.client.get(url)
+        queryset = Cert.objects.filter(pk__in=[cert1.pk, cert2.pk, cert3.pk])
+        self.assertEqual(Cert.bulk_revoke(queryset), 2)
+        for cert in [cert1, cert2]:
+            cert.refresh_from_db()
+            self.assertTrue(cert.revoked)
+            self.assertIsNotNone(cert.revoked_at)
+        response = self.client.get(url)
+        crl = crypto.load_crl(crypto.FILETYPE_PEM, response.content)
+        self.assertEqual(len(crl.get_revoked()), 3)
+
+    def test_crl_view_404(self):
+        url = reverse('x509:crl', args=['3f6e9e04-c3a5-4f5e-a0c4-0a8b87d46d2e'])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_key_pool(self):
+        self.addCleanup(setattr, app_settings, 'KEY_POOL', app_settings.KEY_POOL)
+        app_settings.KEY_POOL = {512: 1}
+        ca = self._create_ca(key_length='512')
+        length, private_key = generate_key(512)
+        PrivateKey.objects.create(length=length, private_key=private_key)
+        self.assertEqual(PrivateKey.get_pool_depth()[512], 1)
+        cert = self._create_cert(ca=ca, key_length='512')
+        self.assertEqual(force_text(cert.private_key), private_key)
+        self.assertEqual(PrivateKey.get_pool_depth()[512], 0)
+        # certificate and private key match
+        key = crypto.load_privatekey(crypto.FILETYPE_PEM, private_key)
+        self.assertEqual(crypto.dump_publickey(crypto.FILETYPE_PEM, cert.x509.get_pubkey()),
+                         crypto.dump_publickey(crypto.FILETYPE_PEM, key))
+        # empty pool, the key is generated
+        cert = self._create_cert(ca=ca, key_length='512', name='cert2')
+        self.assertNotEqual(force_text(cert.private_key), private_key)
+        # ``OpenSSL.crypto`` is restored after generating the certificate
+        self.assertIs(x509_models.crypto, crypto)
+
+    def test_fillkeypool_command(self):
+        self.addCleanup(setattr, app_settings, 'KEY_POOL', app_settings.KEY_POOL)
+        app_settings.KEY_POOL = {512: 1}
+        length, private_key = generate_key(512)
+        PrivateKey.objects.create(length=length, private_key=private_key)
+        # the pool is already full, nothing is generated
+        output = StringIO()
+        call_command('fillkeypool', stdout=output)
+        self.assertIn('512 bit: 1', output.getvalue())
+        self.assertEqual(PrivateKey.objects.count(), 1)
@@ -1,5 +1,35 @@
-from django_x509.base.views import crl
+import hashlib
+from calendar import timegm
+
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import ugettext_lazy as _
+from django_x509 import settings as x509_settings
 
 from .models import Ca
 
-crl.ca_model = Ca
+
+def crl(request, pk):
+    """
+    returns CRL of a CA (see ``Ca.get_cached_crl``),
+    supports conditional requests (``ETag`` and ``Last-Modified``)
+    """
+    if x509_settings.CRL_PROTECTED and not request.user.is_authenticated:
+        return HttpResponse(_('Forbidden'),
+                            status=403,
+                            content_type='text/plain')
+    try:
+        content, generated = Ca.get_cached_crl(pk)
+    except (Ca.DoesNotExist, ValueError):
+        raise Http404()
+    etag = quote_etag(hashlib.md5(content).hexdigest())
+    last_modified = timegm(generated.utctimetuple())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(content,
+                                status=200,
+                                content_type='application/x-pem-file')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
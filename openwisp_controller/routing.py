@@ -0,0 +1,6 @@
+from channels.routing import include
+
+channel_routing = [
+    include('openwisp_controller.geo.channels.routing.channel_routing'),
+    include('openwisp_controller.tasks.task_routing'),
+]
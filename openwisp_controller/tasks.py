@@ -0,0 +1,134 @@
+"""
+Deferred execution of expensive operations
+(template changes, certificate creation, checksum generation)
+
+Tasks are plain module level functions accepting JSON serializable
+arguments, they are passed to ``defer`` and executed by the backend
+configured in ``OPENWISP_CONTROLLER_TASK_BACKEND``:
+
+* ``SyncBackend``: runs tasks immediately (default)
+* ``ThreadBackend``: runs tasks in a pool of threads of the current process
+* ``ChannelsBackend``: sends tasks to the channel layer, tasks are executed
+  by worker processes started with ``./manage.py runtaskworker``
+"""
+import logging
+import threading
+
+from channels import Channel
+from channels.routing import route
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from django.utils.six.moves import queue
+
+from .config import settings as app_settings
+
+logger = logging.getLogger(__name__)
+TASK_CHANNEL = 'openwisp_controller.tasks'
+
+
+def run_task(name, args):
+    """
+    imports and executes a task, exceptions are logged
+    """
+    try:
+        import_string(name)(*args)
+    except Exception:
+        logger.exception('Task {0} failed'.format(name))
+
+
+class SyncBackend(object):
+    """
+    runs tasks immediately in the current thread,
+    exceptions are propagated to the caller
+    """
+    is_async = False
+
+    def enqueue(self, name, args):
+        import_string(name)(*args)
+
+
+class ThreadBackend(object):
+    """
+    runs tasks in a pool of daemon threads (``OPENWISP_CONTROLLER_TASK_THREADS``)
+    started in the current process when the first task is enqueued
+    """
+    is_async = True
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def enqueue(self, name, args):
+        self._start()
+        self.queue.put((name, args))
+
+    def _start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(app_settings.TASK_THREADS):
+                thread = threading.Thread(target=self._work,
+                                          name='openwisp-controller-task-{0}'.format(i))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def _work(self):
+        while True:
+            name, args = self.queue.get()
+            try:
+                run_task(name, args)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+
+class ChannelsBackend(object):
+    """
+    sends tasks to the channel layer (eg: redis),
+    requires ``task_routing`` to be included in the
+    channel routing (see ``openwisp_controller.routing``)
+    """
+    is_async = True
+
+    def enqueue(self, name, args):
+        Channel(TASK_CHANNEL).send({'name': name, 'args': args})
+
+
+def task_consumer(message):
+    run_task(message.content['name'], message.content['args'])
+
+
+task_routing = [route(TASK_CHANNEL, task_consumer)]
+
+_backend = {}
+
+
+def get_backend():
+    """
+    returns the instance of the configured backend
+    """
+    path = app_settings.TASK_BACKEND
+    if path not in _backend:
+        _backend[path] = import_string(path)()
+    return _backend[path]
+
+
+def is_async():
+    return get_backend().is_async
+
+
+def defer(func, *args):
+    """
+    executes ``func(*args)`` with the configured backend;
+    asynchronous backends receive the task only after the
+    current transaction is committed, therefore ``args``
+    must be JSON serializable (eg: ``str(instance.pk)``)
+    """
+    backend = get_backend()
+    if not backend.is_async:
+        return func(*args)
+    name = '{0}.{1}'.format(func.__module__, func.__name__)
+    args = list(args)
+    transaction.on_commit(lambda: backend.enqueue(name, args))
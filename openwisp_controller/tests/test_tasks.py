@@ -0,0 +1,81 @@
+from django.test import TestCase
+
+from openwisp_users.tests.utils import TestOrganizationMixin
+
+from ..config import settings as app_settings
+from ..config.models import Config, Device, Template, Vpn, VpnClient
+from ..config.tasks import create_vpnclient_cert, update_config_checksum
+from ..config.tests import CreateConfigTemplateMixin, TestVpnX509Mixin
+from ..pki.models import Ca, Cert
+from ..tasks import SyncBackend, ThreadBackend, defer, get_backend, task_consumer
+
+results = []
+
+
+def append_result(value):
+    results.append(value)
+
+
+class TestTasks(CreateConfigTemplateMixin, TestVpnX509Mixin,
+                TestOrganizationMixin, TestCase):
+    ca_model = Ca
+    cert_model = Cert
+    config_model = Config
+    device_model = Device
+    template_model = Template
+    vpn_model = Vpn
+
+    def setUp(self):
+        del results[:]
+
+    def _set_task_backend(self, path):
+        default = app_settings.TASK_BACKEND
+        app_settings.TASK_BACKEND = path
+        self.addCleanup(setattr, app_settings, 'TASK_BACKEND', default)
+
+    def test_sync_backend(self):
+        self.assertIsInstance(get_backend(), SyncBackend)
+        defer(append_result, 'sync')
+        self.assertEqual(results, ['sync'])
+
+    def test_thread_backend(self):
+        backend = ThreadBackend()
+        backend.enqueue('{0}.append_result'.format(__name__), ['thread'])
+        backend.queue.join()
+        self.assertEqual(results, ['thread'])
+
+    def test_task_consumer(self):
+        message = type('Message', (object,), {
+            'content': {'name': '{0}.append_result'.format(__name__),
+                        'args': ['channels']}
+        })
+        task_consumer(message)
+        self.assertEqual(results, ['channels'])
+
+    def test_update_config_checksum(self):
+        c = self._create_config(organization=self._create_org())
+        update_config_checksum(str(c.pk))
+        c.refresh_from_db()
+        self.assertEqual(c.checksum_db, c.checksum)
+
+    def test_deferred_vpnclient_cert(self):
+        self._set_task_backend('openwisp_controller.tasks.ThreadBackend')
+        org = self._create_org()
+        vpn = self._create_vpn(organization=org)
+        t = self._create_template(name='vpn-test',
+                                  organization=org,
+                                  type='vpn',
+                                  vpn=vpn,
+                                  auto_cert=True)
+        c = self._create_config(organization=org)
+        c.templates.add(t)
+        client = VpnClient.objects.get(config=c, vpn=vpn)
+        # the task is executed only after the transaction is committed
+        self.assertIsNone(client.cert)
+        create_vpnclient_cert(str(client.pk))
+        client.refresh_from_db()
+        self.assertIsNotNone(client.cert)
+        self.assertEqual(client.cert.organization, org)
+        # refresh_from_db() would keep the cached backend instance
+        c = Config.objects.get(pk=c.pk)
+        self.assertEqual(c.checksum_db, c.checksum)
@@ -45,6 +45,15 @@ url_metadata = [
             'namespace': 'controller'
         }
     },
+    # openwisp_controller.geo (location of mobile devices)
+    {
+        'regexp': r'^',
+        'app': 'openwisp_controller.geo',
+        'include': {
+            'module': '{app}.urls',
+            'namespace': 'geo'
+        }
+    },
     # owm_legacy
     {
         'regexp': r'^',
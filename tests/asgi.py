@@ -0,0 +1,12 @@
+"""
+ASGI entrypoint of the test project, used by the interface server, eg::
+
+    daphne -b 0.0.0.0 -p 8000 asgi:channel_layer
+"""
+import os
+
+from channels.asgi import get_channel_layer
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+
+channel_layer = get_channel_layer()
@@ -78,7 +78,7 @@ ROOT_URLCONF = 'urls'
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'asgiref.inmemory.ChannelLayer',
-        'ROUTING': 'openwisp_controller.geo.channels.routing.channel_routing',
+        'ROUTING': 'openwisp_controller.routing.channel_routing',
     },
 }
 